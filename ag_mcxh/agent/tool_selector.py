@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import Any, List, Tuple
 from ..apis import list_tools
 
 class ToolSelector:
@@ -14,7 +14,7 @@ class ToolSelector:
             tool_descs.append(f"- {name}: {desc}")
         return "\n".join(tool_descs)
     
-    def select_tool_with_vllm(self, vllm_client, prompt: str, image_path: str) -> str:
+    def select_tool_with_vllm(self, vllm_client, prompt: str, image: Any) -> str:
         """使用vLLM模型根据用户提示和图像选择合适的工具"""
         tool_descriptions = self.build_tool_descriptions()
         
@@ -1,7 +1,9 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 # 修复导入路径
-from ..apis.tool import load_tool
+from ..apis.tool import acquire_tool
 from ..tool_finder import search_tool
+from ..tools.pool import configure_tool_pool, get_tool_pool
+from ..types import ErrorResult, ImageIO, ToolResult
 from .tool_selector import ToolSelector
 from .vllm_client import VLLMHTTPClient, VLLMAsyncClient
 
@@ -9,7 +11,11 @@ class VisionAgent:
     """视觉智能体，可以根据自然语言提示自动选择和调用视觉工具"""
     
     def __init__(self, model_path: str = "/home/ps/Qwen2.5-3B", 
-                 host: str = "127.0.0.1", port: int = 8001):
+                 host: str = "127.0.0.1", port: int = 8001,
+                 tool_pool_bytes: Optional[int] = None):
+        # 工具实例池的内存预算（字节），None 表示沿用当前进程级配置
+        if tool_pool_bytes is not None:
+            configure_tool_pool(max_bytes=tool_pool_bytes)
         # 初始化vLLM服务器管理器
         self.vllm_manager = VLLMAsyncClient(model_path, host, port)
         self.vllm_manager.start_server()
@@ -21,30 +27,40 @@ class VisionAgent:
         if hasattr(self, 'vllm_manager'):
             self.vllm_manager.stop_server()
     
-    def _execute_tool(self, tool_name: str, image_path: str, **kwargs) -> str:
-        """执行指定的工具"""
+    def _execute_tool(self, tool_name: str, image: Union[str, bytes, ImageIO],
+                      **kwargs) -> ToolResult:
+        """执行指定的工具，工具实例从进程级工具池获取，避免每次请求重新加载权重
+        
+        工具结果以 ToolResult 返回，字段可直接读取；str(result) 为其 JSON 文本。
+        工具抛出的异常以 ErrorResult 返回
+        """
         try:
-            tool = load_tool(tool_name, **kwargs)
-            from ..types import ImageIO
-            image = ImageIO(image_path)
-            result = tool.apply(image)
-            return result
+            if not isinstance(image, ImageIO):
+                image = ImageIO(image)
+            # 持有租约期间工具不会被其他请求触发的淘汰 teardown
+            with acquire_tool(tool_name, **kwargs) as tool:
+                return tool.apply(image)
         except Exception as e:
-            return f"执行工具时出错: {str(e)}"
+            return ErrorResult.from_exception(e)
+    
+    def tool_pool_stats(self) -> Dict[str, int]:
+        """返回工具池的命中、未命中与淘汰统计"""
+        return get_tool_pool().stats()
     
-    def process_with_vllm(self, prompt: str, image_path: str, **tool_kwargs) -> str:
+    def process_with_vllm(self, prompt: str, image: Union[str, bytes, ImageIO],
+                          **tool_kwargs) -> ToolResult:
         """使用vLLM模型根据提示和图像处理任务
         
         Args:
             prompt (str): 用户的自然语言请求
-            image_path (str): 图像文件路径
+            image (str | bytes | ImageIO): 图像文件路径、图像文件内容或 ImageIO
             **tool_kwargs: 传递给工具的额外参数
             
         Returns:
-            str: 工具执行结果
+            ToolResult: 工具执行结果，出错时为 ErrorResult
         """
         # 选择工具
-        tool_name = self.tool_selector.select_tool_with_vllm(self.vllm_client, prompt, image_path)
+        tool_name = self.tool_selector.select_tool_with_vllm(self.vllm_client, prompt, image)
         
         # 验证工具是否存在
         available_tools = self.tool_selector.get_available_tools()
@@ -60,18 +76,19 @@ class VisionAgent:
                 tool_name = available_tools[0]  # 默认使用第一个工具
         
         # 执行工具
-        result = self._execute_tool(tool_name, image_path, **tool_kwargs)
+        result = self._execute_tool(tool_name, image, **tool_kwargs)
         return result
     
-    def direct_tool_call(self, tool_name: str, image_path: str, **tool_kwargs) -> str:
+    def direct_tool_call(self, tool_name: str, image: Union[str, bytes, ImageIO],
+                         **tool_kwargs) -> ToolResult:
         """直接调用指定的工具
         
         Args:
             tool_name (str): 工具名称
-            image_path (str): 图像文件路径
+            image (str | bytes | ImageIO): 图像文件路径、图像文件内容或 ImageIO
             **tool_kwargs: 传递给工具的额外参数
             
         Returns:
-            str: 工具执行结果
+            ToolResult: 工具执行结果，出错时为 ErrorResult
         """
-        return self._execute_tool(tool_name, image_path, **tool_kwargs)
\ No newline at end of file
+        return self._execute_tool(tool_name, image, **tool_kwargs)
\ No newline at end of file
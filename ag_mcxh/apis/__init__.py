@@ -1,3 +1,3 @@
-from .tool import load_tool, list_tools
+from .tool import load_tool, list_tools, acquire_tool
 
-__all__ = ['load_tool', 'list_tools']
\ No newline at end of file
+__all__ = ['load_tool', 'list_tools', 'acquire_tool']
\ No newline at end of file
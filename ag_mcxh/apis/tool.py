@@ -1,8 +1,9 @@
 from typing import List, Tuple, Optional, Dict, Any
-from ..tools.registry import load_tool, list_tools as list_registered_tools
+from ..tools.registry import load_tool as _load_tool, list_tools as list_registered_tools
+from ..tools.pool import acquire_tool
 
 def load_tool(tool_type: str, **kwargs) -> Any:
-    return load_tool(tool_type, **kwargs)
+    return _load_tool(tool_type, **kwargs)
 
 def list_tools(with_description: bool = False) -> List[str] or List[Tuple[str, str]]:
     if with_description:
@@ -0,0 +1,219 @@
+import ast
+import os
+import shutil
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from ..types.detection import DetectionResult
+from ..utils.box_utils import batched_nms
+from ..utils.images_utils import draw_detections
+
+
+def onnx_export_path(model_path: str, image_size: int = 640) -> str:
+    """Path of the exported ONNX artifact, next to the checkpoint"""
+    stem = os.path.splitext(model_path)[0]
+    return f"{stem}.imgsz{image_size}.onnx"
+
+
+def export_onnx(model_path: str, image_size: int = 640, opset: Optional[int] = None) -> str:
+    """Export a YOLO checkpoint to ONNX, reusing a cached export
+
+    The artifact is written next to the checkpoint and rebuilt only when the
+    checkpoint is newer than it. A deployed artifact is used as is when the
+    checkpoint itself is absent.
+    """
+    onnx_path = onnx_export_path(model_path, image_size)
+    if os.path.exists(onnx_path) and (
+            not os.path.exists(model_path) or
+            os.path.getmtime(onnx_path) >= os.path.getmtime(model_path)):
+        return onnx_path
+    try:
+        from ultralytics import YOLO
+    except ImportError:
+        raise ImportError("Please install ultralytics: pip install ultralytics")
+
+    kwargs = {"format": "onnx", "imgsz": image_size, "dynamic": True}
+    if opset is not None:
+        kwargs["opset"] = opset
+    exported = YOLO(model_path).export(**kwargs)
+    tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+    shutil.move(str(exported), tmp_path)
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def letterbox_shape(shapes, size: int, stride: int = 32, square: bool = False):
+    """Padded (height, width) fitting every image of a batch
+
+    With ``square=False`` the padding only rounds up to the stride, which
+    saves compute on non-square images when the model has dynamic shapes.
+    """
+    if square:
+        return size, size
+    height = width = 0
+    for h, w in shapes:
+        ratio = min(size / h, size / w)
+        height = max(height, int(round(h * ratio)))
+        width = max(width, int(round(w * ratio)))
+    return (-(-height // stride) * stride, -(-width // stride) * stride)
+
+
+def letterbox(image: np.ndarray, size: int, shape=None, pad_value: int = 114):
+    """Resize keeping the aspect ratio to fit ``size`` and pad to ``shape``
+
+    Returns:
+        tuple: The padded image, the scale ratio and the (left, top) padding.
+    """
+    import cv2
+
+    shape = shape or (size, size)
+    h, w = image.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    left, top = (shape[1] - new_w) // 2, (shape[0] - new_h) // 2
+    canvas = np.full((shape[0], shape[1], 3), pad_value, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = image
+    return canvas, ratio, (left, top)
+
+
+class YOLOOnnx:
+    """YOLO detection engine running an exported ONNX model on onnxruntime's CPU provider
+
+    Supports the detection heads of YOLOv8/v11 (anchor-free) and YOLOv5
+    (anchor-based, with objectness), exported without embedded NMS.
+
+    Calls mirror the ultralytics ``YOLO`` model: ``model(images, conf=..., iou=...)``
+    returns one :class:`DetectionResult` per image.
+
+    Args:
+        model_path (str): A YOLO ``.pt`` checkpoint, exported on first use,
+            or an ``.onnx`` file.
+        device (str): Only "cpu" is supported.
+        image_size (int): Inference image size. Defaults to 640.
+        intra_op_threads (int): Threads used inside an operator, 0 lets
+            onnxruntime decide. Defaults to 0.
+        inter_op_threads (int): Threads used across operators, 0 lets
+            onnxruntime decide. Defaults to 0.
+    """
+
+    def __init__(self, model_path: str = "yolo11n.pt", device: str = "cpu",
+                 image_size: int = 640, intra_op_threads: int = 0,
+                 inter_op_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("Please install onnxruntime: pip install onnxruntime")
+
+        self.image_size = image_size
+        self.onnx_path = model_path if model_path.endswith(".onnx") \
+            else export_onnx(model_path, image_size)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            self.onnx_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exports with static spatial dims need square inputs
+        self.dynamic = not all(isinstance(d, int) for d in model_input.shape[2:])
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+        self.to(device)
+
+    def to(self, device):
+        if str(device) != "cpu":
+            raise ValueError(f"YOLOOnnx only runs on cpu, got {device}")
+        return self
+
+    def _load(self, source) -> np.ndarray:
+        if isinstance(source, str):
+            import cv2
+            image = cv2.imread(source)
+            if image is None:
+                raise ValueError(f"Cannot read image: {source}")
+            return image
+        return np.asarray(source)
+
+    def __call__(self, source, conf: float = 0.25, iou: float = 0.45,
+                 classes: Optional[Sequence[int]] = None, max_det: int = 300,
+                 **kwargs) -> List[DetectionResult]:
+        """Run detection on an image path, a BGR array, or a list of them"""
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        images = [self._load(s) for s in sources]
+        if not images:
+            return []
+
+        shape = letterbox_shape([image.shape[:2] for image in images],
+                                self.image_size, square=not self.dynamic)
+        batch = np.empty((len(images), 3) + shape, dtype=np.float32)
+        transforms = []
+        for i, image in enumerate(images):
+            padded, ratio, pad = letterbox(image, self.image_size, shape)
+            # BGR HWC uint8 -> RGB CHW float in [0, 1]
+            np.multiply(padded[..., ::-1].transpose(2, 0, 1), 1 / 255.0, out=batch[i])
+            transforms.append((ratio, pad))
+
+        outputs = self.session.run(None, {self.input_name: batch})[0]
+        return [self._postprocess(pred, image, ratio, pad, conf, iou, classes, max_det)
+                for pred, image, (ratio, pad) in zip(outputs, images, transforms)]
+
+    def _decode(self, pred: np.ndarray):
+        """Split a raw head output into cxcywh boxes and class scores
+
+        Anchor-free heads (YOLOv8/v11, and the "u" YOLOv5 exports of
+        ultralytics) output (4 + num_classes, num_anchors). Anchor-based
+        YOLOv5 exports output (num_anchors, 5 + num_classes) with an
+        objectness column, multiplied into the class scores.
+        """
+        num_classes = len(self.names)
+        if num_classes:
+            anchor_free = pred.shape[0] == 4 + num_classes
+            anchor_based = pred.shape[1] == 5 + num_classes
+        else:
+            # Without class names, anchors are the long axis
+            anchor_free = pred.shape[0] < pred.shape[1]
+            anchor_based = not anchor_free
+        if anchor_free:
+            pred = pred.T
+            return pred[:, :4], pred[:, 4:]
+        if anchor_based:
+            return pred[:, :4], pred[:, 5:] * pred[:, 4:5]
+        raise ValueError(f"Unsupported YOLO ONNX output of shape {pred.shape} for "
+                         f"{num_classes} classes, expected a YOLOv5 or YOLOv8/v11 head")
+
+    def _postprocess(self, pred, image, ratio, pad, conf, iou, classes, max_det,
+                     max_nms: int = 30000):
+        boxes, scores = self._decode(pred)
+        cls = scores.argmax(axis=1)
+        score = scores[np.arange(len(scores)), cls]
+        keep = score > conf
+        if classes is not None:
+            keep &= np.isin(cls, classes)
+        boxes, cls, score = boxes[keep], cls[keep], score[keep]
+        if len(score) > max_nms:
+            top = np.argpartition(-score, max_nms)[:max_nms]
+            boxes, cls, score = boxes[top], cls[top], score[top]
+
+        xyxy = np.empty((len(boxes), 4), dtype=np.float32)
+        xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:4] / 2
+        xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:4] / 2
+
+        keep = batched_nms(xyxy, score, cls, iou)[:max_det]
+        xyxy, score, cls = xyxy[keep], score[keep], cls[keep]
+
+        # Undo the letterbox
+        xyxy -= np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)
+        xyxy /= ratio
+        h, w = image.shape[:2]
+        np.clip(xyxy[:, 0::2], 0, w, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, h, out=xyxy[:, 1::2])
+
+        result = DetectionResult(xyxy, score, cls, self.names)
+        result.render_fn = lambda: draw_detections(image, result)
+        return result
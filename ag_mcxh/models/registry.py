@@ -57,6 +57,13 @@ def _register_common_models():
     
     register_model_loader("YOLO", _load_yolo_model)
     
+    # YOLO exported to ONNX, running on onnxruntime's CPU execution provider
+    def _load_yolo_onnx_model():
+        from .onnx_yolo import YOLOOnnx
+        return YOLOOnnx
+    
+    register_model_loader("YOLO-ONNX", _load_yolo_onnx_model)
+    
     # SAM model lazy loading
     def _load_sam_model():
         try:
@@ -1,72 +1,166 @@
 from .registry import register_model
-from typing import Any
+from ..utils import load_or_build_object, release_object
+from ..utils.embedding_cache import set_image_cached
+from typing import Any, Optional, Tuple
+import os
+import threading
 
-@register_model("SAM-ViT-H")
-class SAMViTH:
-    """SAM ViT-H Model"""
-    
-    def __init__(self, model_path: str = "sam_vit_h_4b8939.pth", device: str = "cpu"):
-        self.model_path = model_path
+SAM_VARIANTS = ("vit_b", "vit_l", "vit_h")
+
+
+def infer_sam_variant(checkpoint: str, default: Optional[str] = None) -> str:
+    """Infer the SAM variant from a checkpoint name, e.g. sam_vit_l_0b3195.pth"""
+    name = os.path.basename(str(checkpoint)).lower().replace("-", "_")
+    for variant in SAM_VARIANTS:
+        if variant in name:
+            return variant
+    if default is not None:
+        return default
+    raise ValueError(f"Cannot infer the SAM variant of {checkpoint}, "
+                     f"expected one of {SAM_VARIANTS} in its name")
+
+
+def build_sam(variant: str, checkpoint: str, device: str = "cpu"):
+    """Build a SAM model of the given variant ("vit_b", "vit_l" or "vit_h")"""
+    try:
+        from segment_anything import sam_model_registry
+    except ImportError:
+        raise ImportError("Please install segment-anything: pip install git+https://github.com/facebookresearch/segment-anything.git")
+    sam = sam_model_registry[variant](checkpoint=checkpoint)
+    sam.to(device=device)
+    # Identifies the weights in embedding cache keys
+    sam.model_id = f"{variant}:{checkpoint}"
+    return sam
+
+
+def load_sam(variant: Optional[str], checkpoint: str, device: str = "cpu"):
+    """Load a SAM model shared by every caller asking for the same weights
+
+    ``variant`` None infers it from the checkpoint name. Release the model
+    with ``ag_mcxh.utils.release_object`` when no longer needed.
+    """
+    if checkpoint and os.path.exists(checkpoint):
+        checkpoint = os.path.realpath(checkpoint)
+    variant = variant or infer_sam_variant(checkpoint)
+    return load_or_build_object(build_sam, variant, checkpoint, device)
+
+
+def read_sam_image(image: Any, image_format: str = "RGB") -> Tuple[Any, str]:
+    """Return ``(HWC uint8 array, channel order)`` for an image file, array or ImageIO
+
+    Files are decoded by cv2 (BGR), ImageIO by PIL (RGB), and arrays are
+    used as is in ``image_format``.
+    """
+    if isinstance(image, str):
+        import cv2
+        array = cv2.imread(image)
+        if array is None:
+            raise ValueError(f"Cannot read image: {image}")
+        return array, "BGR"
+    if hasattr(image, "to_array"):
+        return image.to_array(), "RGB"
+    return image, image_format
+
+
+@register_model("SAM-ViT")
+class SAMModel:
+    """SAM model of any variant (ViT-B/L/H), inferred from the checkpoint name
+
+    Every wrapper and tool loading the same checkpoint on the same device
+    shares one set of weights, and image embeddings go through the shared
+    embedding cache.
+    """
+
+    default_model_path = "sam_vit_h_4b8939.pth"
+    variant: Optional[str] = None
+
+    def __init__(self, model_path: Optional[str] = None, device: str = "cpu",
+                 variant: Optional[str] = None):
+        self.model_path = model_path or self.default_model_path
         self.device = device
+        self.variant = variant or self.variant or infer_sam_variant(self.model_path)
         self._predictor = None
-    
+        self._session_predictor = None
+        self._sessions = None
+        self._lock = threading.Lock()
+        # Guards the lazy predictor and sessions; re-entrant as sessions() calls load()
+        self._init_lock = threading.RLock()
+
     def load(self):
         """Load the model"""
-        if self._predictor is None:
-            try:
-                from segment_anything import sam_model_registry, SamPredictor
-                import torch
-                
-                sam = sam_model_registry["vit_h"](checkpoint=self.model_path)
-                sam.to(device=self.device)
+        with self._init_lock:
+            if self._predictor is None:
+                try:
+                    from segment_anything import SamPredictor
+                except ImportError:
+                    raise ImportError("Please install segment-anything: pip install git+https://github.com/facebookresearch/segment-anything.git")
+                sam = load_sam(self.variant, self.model_path, self.device)
                 self._predictor = SamPredictor(sam)
-            except ImportError:
-                raise ImportError("Please install segment-anything: pip install git+https://github.com/facebookresearch/segment-anything.git")
-        return self._predictor
-    
-    def predict(self, image_path: str, **kwargs):
-        """Run prediction on image"""
-        import cv2
+            return self._predictor
+
+    def unload(self):
+        """Release the shared model weights"""
+        with self._init_lock:
+            if self._session_predictor is not None:
+                release_object(self._session_predictor)
+                self._session_predictor = None
+                self._sessions = None
+            if self._predictor is not None:
+                release_object(self._predictor.model)
+                self._predictor = None
+
+    def predict(self, image, image_format: str = "RGB", **kwargs):
+        """Run prediction on an image path, an array or an ImageIO
+
+        The image embedding is reused when the same image was seen before.
+        """
         predictor = self.load()
-        
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Cannot read image: {image_path}")
-            
-        predictor.set_image(image)
-        return predictor.predict(**kwargs)
+        image, image_format = read_sam_image(image, image_format)
+        # The upstream predictor keeps the image state between both calls
+        with self._lock:
+            set_image_cached(predictor, image, image_format)
+            return predictor.predict(**kwargs)
+
+    def sessions(self, ttl: float = 600.0, max_bytes: int = 512 << 20):
+        """Interactive segmentation sessions on this model"""
+        with self._init_lock:
+            if self._sessions is None:
+                from ..tools.segmentation.sam_session import SamSessionManager
+                from ..tools.segmentation.segment_anything import SamPredictor
+                # Same arguments as load_sam_and_predictor: shared with the SAM tools
+                self._session_predictor = load_or_build_object(
+                    SamPredictor, self.load().model, max_batch_size=1, batch_window_ms=5.0)
+                self._sessions = SamSessionManager(self._session_predictor, ttl, max_bytes)
+            return self._sessions
+
+    def open_session(self, image, image_format: str = "RGB") -> str:
+        """Encode an image once; returns a session id for predict_session"""
+        return self.sessions().open_session(image, image_format)
+
+    def predict_session(self, session_id: str, **kwargs):
+        """Decode prompts on a session image, without re-encoding it"""
+        return self.sessions().predict(session_id, **kwargs)
+
+    def close_session(self, session_id: str):
+        self.sessions().close_session(session_id)
+
+@register_model("SAM-ViT-H")
+class SAMViTH(SAMModel):
+    """SAM ViT-H Model"""
+
+    default_model_path = "sam_vit_h_4b8939.pth"
+    variant = "vit_h"
 
 @register_model("SAM-ViT-L")
-class SAMViTL:
+class SAMViTL(SAMModel):
     """SAM ViT-L Model"""
-    
-    def __init__(self, model_path: str = "sam_vit_l_0b3195.pth", device: str = "cpu"):
-        self.model_path = model_path
-        self.device = device
-        self._predictor = None
-    
-    def load(self):
-        """Load the model"""
-        if self._predictor is None:
-            try:
-                from segment_anything import sam_model_registry, SamPredictor
-                import torch
-                
-                sam = sam_model_registry["vit_l"](checkpoint=self.model_path)
-                sam.to(device=self.device)
-                self._predictor = SamPredictor(sam)
-            except ImportError:
-                raise ImportError("Please install segment-anything: pip install git+https://github.com/facebookresearch/segment-anything.git")
-        return self._predictor
-    
-    def predict(self, image_path: str, **kwargs):
-        """Run prediction on image"""
-        import cv2
-        predictor = self.load()
-        
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Cannot read image: {image_path}")
-            
-        predictor.set_image(image)
-        return predictor.predict(**kwargs)
\ No newline at end of file
+
+    default_model_path = "sam_vit_l_0b3195.pth"
+    variant = "vit_l"
+
+@register_model("SAM-ViT-B")
+class SAMViTB(SAMModel):
+    """SAM ViT-B Model"""
+
+    default_model_path = "sam_vit_b_01ec64.pth"
+    variant = "vit_b"
@@ -25,6 +25,28 @@ class YOLOv8:
         """Run prediction on image"""
         model = self.load()
         return model(image_path, **kwargs)
+    
+    def stream(self, source, frame_skip: int = 0, batch_size: int = 1,
+               queue_size: int = 4, realtime: bool = False, **kwargs):
+        """Run detection on a video file, stream URL, camera index or frame iterator
+        
+        Decoding, inference and result conversion run on separate threads.
+        Iterating the returned pipeline yields ``(frame index, frame, DetectionResult)``,
+        and its ``stats()`` reports per-stage FPS.
+        """
+        from ..types.detection import DetectionResult
+        from ..utils.video_utils import VideoPipeline
+        
+        model = self.load()
+        kwargs.setdefault("verbose", False)
+        return VideoPipeline(
+            source,
+            infer_fn=lambda frames: model(frames, **kwargs),
+            encode_fn=lambda frame, result: DetectionResult.from_yolo(result),
+            frame_skip=frame_skip,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            realtime=realtime)
 
 @register_model("YOLOv5")
 class YOLOv5:
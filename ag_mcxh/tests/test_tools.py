@@ -0,0 +1,123 @@
+import threading
+
+import numpy as np
+import pytest
+
+from ag_mcxh.tools.base import BaseTool
+from ag_mcxh.tools.pool import ToolPool
+from ag_mcxh.tools.registry import register_tool
+
+TEARDOWNS = []
+SHARED_WEIGHTS = np.zeros(1000, dtype=np.uint8)
+
+
+@register_tool('_PoolTestTool')
+class PoolTestTool(BaseTool):
+
+    def __init__(self, size: int = 1000, fail: bool = False, shared: bool = False,
+                 toolmeta=None):
+        super().__init__(toolmeta=toolmeta)
+        self.size = size
+        self.fail = fail
+        self.shared = shared
+
+    def setup(self):
+        if self.fail:
+            raise RuntimeError('setup failed')
+        self.weights = SHARED_WEIGHTS if self.shared else np.zeros(self.size, np.uint8)
+
+    def teardown(self):
+        TEARDOWNS.append(self.size)
+        self.weights = None
+
+    def apply(self, x):
+        return x
+
+
+@pytest.fixture(autouse=True)
+def clear_teardowns():
+    TEARDOWNS.clear()
+
+
+def test_pool_reuses_instances_by_arguments():
+    pool = ToolPool()
+    with pool.get('_PoolTestTool', size=1000) as first:
+        pass
+    # Defaults are applied before keying
+    with pool.get('_PoolTestTool') as second:
+        assert second is first
+    assert pool.stats()['hits'] == 1
+    assert pool.stats()['misses'] == 1
+
+
+def test_pool_evicts_lru_over_max_bytes():
+    pool = ToolPool(max_bytes=2500)
+    for size in (1000, 1001, 1002):
+        pool.get('_PoolTestTool', size=size).release()
+    # 1000 is the least recently used once 1002 is added
+    assert TEARDOWNS == [1000]
+    pool.get('_PoolTestTool', size=1001).release()
+    pool.get('_PoolTestTool', size=1003).release()
+    assert TEARDOWNS == [1000, 1002]
+    assert pool.nbytes == 1001 + 1003
+    assert pool.stats()['evictions'] == 2
+
+
+def test_pool_defers_teardown_while_leased():
+    pool = ToolPool(max_items=1)
+    lease = pool.get('_PoolTestTool', size=1)
+    pool.get('_PoolTestTool', size=2).release()
+    # Evicted but still in use
+    assert TEARDOWNS == []
+    assert lease.apply(3) == 3
+    lease.release()
+    assert TEARDOWNS == [1]
+    lease.release()
+    assert TEARDOWNS == [1]
+
+
+def test_pool_clear_defers_leased_tools():
+    pool = ToolPool()
+    lease = pool.get('_PoolTestTool', size=1)
+    pool.get('_PoolTestTool', size=2).release()
+    pool.clear()
+    assert TEARDOWNS == [2]
+    lease.release()
+    assert TEARDOWNS == [2, 1]
+
+
+def test_pool_failed_setup_releases_key_lock():
+    pool = ToolPool()
+    with pytest.raises(RuntimeError):
+        pool.get('_PoolTestTool', fail=True)
+    assert pool._key_locks == {}
+    assert len(pool) == 0
+
+
+def test_pool_counts_shared_weights_once():
+    pool = ToolPool()
+    pool.get('_PoolTestTool', size=1, shared=True).release()
+    pool.get('_PoolTestTool', size=2, shared=True).release()
+    assert pool.nbytes == SHARED_WEIGHTS.nbytes
+
+
+def test_pool_builds_once_under_concurrency():
+    pool = ToolPool()
+    leases = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        leases.append(pool.get('_PoolTestTool', size=5))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(lease.tool) for lease in leases}) == 1
+    assert pool.stats()['misses'] == 1
+    assert pool.stats()['in_use'] == 1
+    for lease in leases:
+        lease.release()
+    assert pool.stats()['in_use'] == 0
@@ -0,0 +1,171 @@
+import io
+import json
+import multiprocessing as mp
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ag_mcxh.types import (DetectionResult, ErrorResult, ImageIO, ImageResult, LowResMasks,
+                           MaskResult, RLEMask, SharedImageIO, ToolResult)
+from ag_mcxh.types.shared_io import SharedMemoryPool
+
+
+def random_masks(n=3, h=37, w=53, seed=0):
+    rng = np.random.default_rng(seed)
+    masks = rng.random((n, h, w)) > 0.6
+    masks[0] = False
+    masks[1, 5:20, 10:30] = True
+    return masks
+
+
+def encode_image(size, fmt='JPEG'):
+    image = Image.fromarray(np.random.default_rng(0).integers(
+        0, 255, (size[1], size[0], 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_detection_result_round_trip():
+    result = DetectionResult(
+        np.array([[1, 2, 30, 40], [5, 6, 7, 8]]), [0.9, 0.5], [1, 0],
+        {0: 'person', 1: 'bus'}).with_meta(image_path='out.jpg')
+    restored = ToolResult.from_bytes(result.to_bytes())
+    assert isinstance(restored, DetectionResult)
+    np.testing.assert_array_equal(restored.xyxy, result.xyxy)
+    np.testing.assert_array_equal(restored.conf, result.conf)
+    np.testing.assert_array_equal(restored.cls, result.cls)
+    assert restored.to_json() == result.to_json()
+    assert json.loads(str(result))['image_path'] == 'out.jpg'
+    assert restored.select([1]).meta == {'image_path': 'out.jpg'}
+
+
+def test_mask_result_round_trip():
+    masks = RLEMask.encode_batch(random_masks())
+    result = MaskResult(masks, scores=[0.1, 0.2, 0.3], labels=['a', 'b', 'c'],
+                        image=ImageIO(np.zeros((37, 53, 3), np.uint8)))
+    restored = ToolResult.from_bytes(result.to_bytes())
+    assert isinstance(restored, MaskResult)
+    assert restored.rle_masks == masks
+    np.testing.assert_array_equal(restored.boxes, result.boxes)
+    np.testing.assert_array_equal(restored.image.to_array(), result.image.to_array())
+    assert restored.to_json() == result.to_json()
+
+
+def test_image_and_error_result_round_trip():
+    pixels = np.arange(4 * 5 * 3, dtype=np.uint8).reshape(4, 5, 3)
+    restored = ToolResult.from_bytes(ImageResult(pixels).to_bytes())
+    np.testing.assert_array_equal(restored.to_array(), pixels)
+    assert json.loads(str(restored))['image']['width'] == 5
+
+    error = ErrorResult.from_exception(FileNotFoundError('missing'))
+    restored = ToolResult.from_bytes(error.to_bytes())
+    assert (restored.message, restored.error_type) == ('missing', 'FileNotFoundError')
+    with pytest.raises(ValueError):
+        ToolResult.from_bytes(b'not a result')
+
+
+def test_rle_mask_matches_coco():
+    mask_utils = pytest.importorskip('pycocotools.mask')
+    masks = random_masks()
+    for mask, rle in zip(masks, RLEMask.encode_batch(masks)):
+        coco = mask_utils.encode(np.asfortranarray(mask.astype(np.uint8)))
+        assert rle.to_coco()['counts'] == coco['counts'].decode('ascii')
+        assert rle.area == int(mask_utils.area(coco))
+        np.testing.assert_array_equal(rle.bbox, mask_utils.toBbox(coco))
+        np.testing.assert_array_equal(rle.decode(), mask)
+        assert RLEMask.from_coco(coco) == rle
+    a, b = RLEMask.encode_batch(masks[1:])
+    coco_a, coco_b = (mask_utils.encode(np.asfortranarray(m.astype(np.uint8)))
+                      for m in masks[1:])
+    assert a.iou(b) == pytest.approx(mask_utils.iou([coco_a], [coco_b], [0])[0, 0])
+    np.testing.assert_array_equal(a.union(b).decode(), masks[1] | masks[2])
+    np.testing.assert_array_equal(a.intersection(b).decode(), masks[1] & masks[2])
+
+
+def test_low_res_masks_match_sam_postprocess():
+    torch = pytest.importorskip('torch')
+    sam = pytest.importorskip('segment_anything.modeling.sam')
+    original_size, input_size = (300, 451), (681, 1024)
+    logits = torch.randn(2, 1, 256, 256)
+    model = SimpleNamespace(image_encoder=SimpleNamespace(img_size=1024))
+    expected = sam.Sam.postprocess_masks(model, logits, input_size, original_size).numpy()
+
+    masks = LowResMasks(logits, input_size, original_size)
+    np.testing.assert_allclose(masks.upscale(return_logits=True), expected, atol=1e-4)
+    np.testing.assert_allclose(
+        masks.upscale(index=1, crop=(100, 50, 220, 90), return_logits=True),
+        expected[1, :, 50:90, 100:220], atol=1e-4)
+    # Boxes contain the full resolution masks
+    binary = expected > 0
+    for box, mask in zip(masks.boxes().reshape(-1, 4), binary.reshape(-1, *original_size)):
+        ys, xs = np.nonzero(mask)
+        if len(ys):
+            assert box[0] <= xs.min() and box[1] <= ys.min()
+            assert box[2] >= xs.max() + 1 and box[3] >= ys.max() + 1
+
+
+def test_image_io_target_size_and_to_original():
+    data = encode_image((1600, 1200))
+    full = ImageIO(data)
+    reduced = ImageIO(data, target_size=400)
+    assert reduced.size == (400, 300)
+    assert reduced.reduction == 4
+    assert reduced.original_size == full.size == (1600, 1200)
+    assert reduced.view_key() != full.view_key()
+    assert reduced.digest == full.digest
+    boxes = reduced.to_original([[10, 20, 30, 40], [390, 290, 400, 300]])
+    np.testing.assert_array_equal(boxes, [[40, 80, 120, 160], [1560, 1160, 1600, 1200]])
+    # Never reduced below the target
+    assert ImageIO(data, target_size=1000).reduction == 1
+
+    png = ImageIO(encode_image((1601, 900), 'PNG'), target_size=(400, 200))
+    assert png.size == (401, 225)
+    assert png.reduction == 4
+    np.testing.assert_array_equal(png.to_original([[0, 0, 401, 225]]), [[0, 0, 1601, 900]])
+
+
+def _read_shared(image):
+    with image:
+        pixels = image.to_array()
+        value, shape = int(pixels[0, 0, 0]), pixels.shape
+    # Detach so the owner can recycle the segment
+    del pixels
+    return value, shape
+
+
+def test_shared_image_io_across_processes():
+    pool = SharedMemoryPool()
+    first = SharedImageIO(np.full((64, 48, 3), 7, np.uint8), pool=pool)
+    with mp.get_context('spawn').Pool(1) as workers:
+        assert workers.apply(_read_shared, (first,)) == (7, (64, 48, 3))
+        handle = first.handle
+        first.release()
+        # The segment is reused and stale handles are rejected
+        second = SharedImageIO(np.full((64, 48, 3), 9, np.uint8), pool=pool)
+        assert second.name == handle.name
+        assert pool.stats()['reused'] == 1
+        with pytest.raises(RuntimeError):
+            SharedImageIO.attach(handle)
+        assert workers.apply(_read_shared, (second,)) == (9, (64, 48, 3))
+        second.release()
+    pool.close()
+
+
+def test_shared_image_io_keeps_arrays_valid_after_release():
+    pool = SharedMemoryPool()
+    image = SharedImageIO(np.full((32, 32, 3), 1, np.uint8), pool=pool)
+    kept = image.to_array()
+    image.release()
+    with pytest.raises(RuntimeError):
+        image.to_array()
+    other = SharedImageIO(np.full((32, 32, 3), 2, np.uint8), pool=pool)
+    # The segment of a live array is not recycled
+    assert other.name != image.name
+    assert kept.max() == 1
+    del kept
+    other.release()
+    assert pool.stats()['free_segments'] == 2
+    pool.close()
@@ -0,0 +1,155 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ag_mcxh.utils import (clear_object_cache, evict_object, load_or_build_object,
+                           release_object)
+from ag_mcxh.utils.batching import MicroBatcher
+from ag_mcxh.utils.box_utils import batched_nms, nms, tile_grid
+
+
+class Model:
+
+    def __init__(self, name, device='cpu'):
+        self.name = name
+        self.device = device
+
+
+def test_object_cache_refcounts():
+    clear_object_cache()
+    first = load_or_build_object(Model, 'a')
+    # Positional and keyword spellings share one entry
+    assert load_or_build_object(Model, name='a', device='cpu') is first
+    assert load_or_build_object(Model, 'a', device='cuda') is not first
+    assert release_object(first) == 1
+    assert load_or_build_object(Model, 'a') is first
+    assert release_object(first) == 1
+    assert release_object(first) == 0
+    assert load_or_build_object(Model, 'a') is not first
+    clear_object_cache()
+
+
+def test_object_cache_evict():
+    clear_object_cache()
+    first = load_or_build_object(Model, 'b')
+    load_or_build_object(Model, 'b')
+    assert evict_object(first)
+    assert not evict_object(first)
+    assert release_object(first) == 0
+    assert load_or_build_object(Model, 'b') is not first
+    clear_object_cache()
+
+
+def test_micro_batcher_keeps_order():
+    batches = []
+
+    def batch_fn(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(i) for i in range(10)]
+        assert [f.result(timeout=5) for f in futures] == [i * 10 for i in range(10)]
+    finally:
+        batcher.close()
+    assert [item for batch in batches for item in batch] == list(range(10))
+    assert max(len(batch) for batch in batches) <= 4
+    assert len(batches) < 10
+
+
+def test_micro_batcher_concurrent_callers():
+    batcher = MicroBatcher(lambda items: [-item for item in items],
+                           max_batch_size=8, max_wait_ms=20)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        batcher.close()
+    assert results == {i: -i for i in range(16)}
+
+
+def test_micro_batcher_propagates_errors():
+    def batch_fn(items):
+        if 'bad' in items:
+            raise ValueError('bad item')
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=50)
+    try:
+        good, bad = batcher.submit('good'), batcher.submit('bad')
+        for future in (good, bad):
+            with pytest.raises(ValueError, match='bad item'):
+                future.result(timeout=5)
+        # The worker survives a failed batch
+        assert batcher('again') == 'again'
+    finally:
+        batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit('closed')
+
+
+def test_micro_batcher_rejects_wrong_result_count():
+    batcher = MicroBatcher(lambda items: [], max_batch_size=1)
+    try:
+        with pytest.raises(RuntimeError, match='results'):
+            batcher(1)
+    finally:
+        batcher.close()
+
+
+def test_nms_iou():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30]], np.float32)
+    scores = np.array([0.9, 0.8, 0.7])
+    np.testing.assert_array_equal(nms(boxes, scores, 0.5), [0, 2])
+    np.testing.assert_array_equal(nms(boxes, scores, 0.9), [0, 1, 2])
+    # Kept by decreasing score
+    np.testing.assert_array_equal(nms(boxes, scores[::-1].copy(), 0.5), [2, 1])
+    assert len(nms(np.zeros((0, 4)), np.zeros(0))) == 0
+    with pytest.raises(ValueError):
+        nms(boxes, scores, metric='giou')
+
+
+def test_nms_ios_merges_contained_boxes():
+    boxes = np.array([[0, 0, 100, 100], [10, 10, 40, 40]], np.float32)
+    scores = np.array([0.9, 0.8])
+    np.testing.assert_array_equal(nms(boxes, scores, 0.45, 'iou'), [0, 1])
+    np.testing.assert_array_equal(nms(boxes, scores, 0.45, 'ios'), [0])
+    # Only across groups, and only when a box is cut by a seam
+    np.testing.assert_array_equal(
+        nms(boxes, scores, 0.45, 'ios', groups=[0, 0]), [0, 1])
+    np.testing.assert_array_equal(
+        nms(boxes, scores, 0.45, 'ios', groups=[0, 1], partial=[False, False]), [0, 1])
+    np.testing.assert_array_equal(
+        nms(boxes, scores, 0.45, 'ios', groups=[0, 1], partial=[False, True]), [0])
+
+
+def test_batched_nms_per_class():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 10, 10]], np.float32)
+    scores = np.array([0.9, 0.8, 0.7])
+    classes = np.array([0, 1, 0])
+    np.testing.assert_array_equal(batched_nms(boxes, scores, classes, 0.5), [0, 1])
+
+
+def test_tile_grid_covers_image():
+    windows = tile_grid(1000, 1500, 640, 0.2)
+    assert windows[:, 2].max() == 1500 and windows[:, 3].max() == 1000
+    assert (windows[:, 2] - windows[:, 0]).max() == 640
+    covered = np.zeros((1000, 1500), bool)
+    for x0, y0, x1, y1 in windows:
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+    # Adjacent tiles overlap by at least the requested ratio
+    xs = np.unique(windows[:, 0])
+    assert (np.diff(xs) <= 640 * 0.8).all()
+    np.testing.assert_array_equal(tile_grid(300, 400, 640, 0.2), [[0, 0, 400, 300]])
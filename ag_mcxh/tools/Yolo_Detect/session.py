@@ -0,0 +1,226 @@
+import threading
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from ...types.detection import DetectionResult
+from ...utils import load_or_build_object, release_object
+from ...utils.batching import MicroBatcher
+from ...utils.box_utils import batched_nms, tile_grid
+from ...utils.images_utils import draw_detections
+
+
+class LoadedYolo:
+    """A YOLO model loaded on a device, shared through the object cache.
+
+    The ultralytics predictor keeps per-call state, so calls on the same
+    model are serialized with ``lock``.
+    """
+
+    def __init__(self, model_path: str, device: str = 'cuda'):
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+        self.model.to(device)
+        self.device = device
+        self.lock = threading.Lock()
+
+
+def parse_classes(classes: Union[str, Sequence[int], None]) -> Optional[List[int]]:
+    """Parse class indices given as a comma separated string or a list."""
+    if not classes:
+        return None
+    if isinstance(classes, str):
+        try:
+            return [int(x) for x in classes.split(',')]
+        except ValueError:
+            print("Invalid class indices, using all classes")
+            return None
+    return [int(x) for x in classes]
+
+
+def _touches_seam(boxes: np.ndarray, window: np.ndarray, width: int, height: int,
+                  margin: float = 2.0) -> np.ndarray:
+    """Whether boxes touch a border of their tile that is not an image border."""
+    x0, y0, x1, y1 = window.tolist()
+    return (((boxes[:, 0] <= x0 + margin) & (x0 > 0)) |
+            ((boxes[:, 1] <= y0 + margin) & (y0 > 0)) |
+            ((boxes[:, 2] >= x1 - margin) & (x1 < width)) |
+            ((boxes[:, 3] >= y1 - margin) & (y1 < height)))
+
+
+class YoloSession:
+    """A persistent YOLO inference session.
+
+    The session holds the loaded model, the device and the predictor, which
+    is built once by :meth:`warmup` and then reused by every call.
+
+    Args:
+        model_path (str): Path of the YOLO checkpoint.
+        device (str): The device to run inference on. Defaults to 'cuda'.
+        conf_threshold (float): Confidence threshold. Defaults to 0.5.
+        iou_threshold (float): IoU threshold of NMS. Defaults to 0.45.
+        image_size (int): Inference image size. Defaults to 640.
+        classes (str | list[int]): Class indices to keep, all classes if
+            empty. Defaults to ''.
+        warmup (bool): Whether to run a dummy forward pass on creation so
+            the first request does not pay for predictor setup.
+            Defaults to True.
+        max_batch_size (int): Maximum number of concurrent :meth:`infer`
+            calls merged into one forward pass. 1 disables batching.
+            Defaults to 1.
+        batch_window_ms (float): How long to wait for more images once the
+            first one arrived, in milliseconds. Defaults to 5.
+    """
+
+    def __init__(self,
+                 model_path: str,
+                 device: str = 'cuda',
+                 conf_threshold: float = 0.5,
+                 iou_threshold: float = 0.45,
+                 image_size: int = 640,
+                 classes: Union[str, Sequence[int], None] = '',
+                 warmup: bool = True,
+                 max_batch_size: int = 1,
+                 batch_window_ms: float = 5.0):
+        self.model_path = model_path
+        self.device = device
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.image_size = image_size
+        self.class_indices = parse_classes(classes)
+        self._loaded = load_or_build_object(LoadedYolo, model_path, device)
+        self._warm = False
+        self._batcher = None
+        if max_batch_size > 1:
+            self._batcher = MicroBatcher(
+                self.predict,
+                max_batch_size=max_batch_size,
+                max_wait_ms=batch_window_ms,
+                name='YoloSessionBatcher')
+        if warmup:
+            self.warmup()
+
+    @property
+    def model(self):
+        return self._loaded.model
+
+    @property
+    def names(self):
+        return self._loaded.model.names
+
+    def warmup(self):
+        """Build the predictor with a dummy image."""
+        if not self._warm:
+            dummy = np.zeros((self.image_size, self.image_size, 3), dtype=np.uint8)
+            self.predict(dummy)
+            self._warm = True
+
+    def predict(self, images):
+        """Run the model on one image or a list of images.
+
+        Args:
+            images: An image path, a BGR ndarray, or a list of them.
+
+        Returns:
+            list: The ultralytics ``Results`` of each image.
+        """
+        with self._loaded.lock:
+            return self._loaded.model(
+                images,
+                conf=self.conf_threshold,
+                iou=self.iou_threshold,
+                imgsz=self.image_size,
+                device=self.device,
+                classes=self.class_indices,
+                verbose=False)
+
+    def infer(self, image):
+        """Run the model on a single image.
+
+        With batching enabled, concurrent calls are merged into one forward
+        pass.
+
+        Returns:
+            The ultralytics ``Results`` of the image.
+        """
+        if self._batcher is not None:
+            return self._batcher(image)
+        return self.predict(image)[0]
+
+    def predict_tiled(self,
+                      image: np.ndarray,
+                      tile_size: int = 640,
+                      overlap: float = 0.2,
+                      tile_batch_size: int = 8,
+                      include_full_image: bool = True,
+                      merge_metric: str = 'iou') -> DetectionResult:
+        """Sliced inference for images much larger than the model input.
+
+        The image is cut into overlapping tiles (views, no copies) that run
+        ``tile_batch_size`` at a time through one forward pass each, so peak
+        memory depends on the batch, not on the image size. Tile boxes are
+        shifted back to image coordinates and merged with class-aware NMS.
+
+        Args:
+            image (np.ndarray): The BGR image.
+            tile_size (int): Side of the square tiles. Defaults to 640.
+            overlap (float): Overlap ratio between adjacent tiles.
+                Defaults to 0.2.
+            tile_batch_size (int): Tiles per forward pass. Defaults to 8.
+            include_full_image (bool): Also run the downscaled full image, to
+                keep objects larger than a tile. Defaults to True.
+            merge_metric (str): Overlap metric of the cross-tile NMS, 'iou'
+                or 'ios'. With 'ios', boxes from different tiles where one
+                touches an inner tile border are compared by intersection
+                over the smaller box, merging objects cut by the border;
+                every other pair, e.g. nested objects on one tile, still
+                uses IoU. Defaults to 'iou'.
+
+        Returns:
+            DetectionResult: The merged detections.
+        """
+        height, width = image.shape[:2]
+        windows = tile_grid(height, width, tile_size, overlap)
+        parts, groups, partial = [], [], []
+        if include_full_image:
+            parts.append(DetectionResult.from_yolo(self.predict(image)[0], self.names))
+            groups.append(np.full(len(parts[-1]), -1))
+            partial.append(np.zeros(len(parts[-1]), dtype=bool))
+
+        for start in range(0, len(windows), tile_batch_size):
+            batch = windows[start:start + tile_batch_size]
+            tiles = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in batch.tolist()]
+            for index, (window, result) in enumerate(zip(batch, self.predict(tiles)),
+                                                     start):
+                detections = DetectionResult.from_yolo(result, self.names)
+                if len(detections):
+                    x0, y0 = window[:2].tolist()
+                    detections.xyxy += np.array([x0, y0, x0, y0], dtype=np.float32)
+                    parts.append(detections)
+                    groups.append(np.full(len(detections), index))
+                    partial.append(_touches_seam(detections.xyxy, window, width, height))
+
+        merged = DetectionResult.concatenate(parts, self.names)
+        keep = batched_nms(merged.xyxy, merged.conf, merged.cls,
+                           self.iou_threshold, merge_metric,
+                           np.concatenate(groups) if groups else None,
+                           np.concatenate(partial) if partial else None)
+        merged = merged.select(keep)
+        merged.render_fn = lambda: draw_detections(image, merged)
+        return merged
+
+    def close(self):
+        """Release the shared model."""
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
+        if self._loaded is not None:
+            release_object(self._loaded)
+            self._loaded = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,84 +1,203 @@
 from ...tools.base import BaseTool
-from ...types import Annotated, ImageIO, Info
+from ...types import Annotated, DetectionResult, ImageIO, Info
+from ...utils.images_utils import IMAGE_FORMATS, AsyncImageWriter, content_digest
+from ...utils.video_utils import VideoPipeline
+from .session import YoloSession
+from collections import OrderedDict
 import sys
 import os
 import argparse
-import torch
-from ultralytics import YOLO
+import glob
 import cv2
 import numpy as np
 import json
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+
+# none: only return boxes; on_demand: keep results so the annotated image
+# can be rendered later with ``YoloDetect.render``; async: render, encode and
+# write the annotated image on a background writer pool.
+RENDER_MODES = ('none', 'on_demand', 'async')
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--model_path', type=str, 
                        default='./yolo11n.pt')
     parser.add_argument('--image_path', type=str, 
-                       default='/home/ps/MCXH/Agent_MCXH/pics/002.png')
+                       default='/home/ps/MCXH/Agent_MCXH/pics/002.png',
+                       help='An image file, a directory of images or a glob pattern')
     parser.add_argument('--device', type=str, default='cuda')
     parser.add_argument('--conf_threshold', type=float, default=0.5)
     parser.add_argument('--iou_threshold', type=float, default=0.45)
     parser.add_argument('--image_size', type=int, default=640)
     parser.add_argument('--classes', type=str, default='')
+    parser.add_argument('--tile_size', type=int, default=0,
+                       help='Tile size of sliced inference for large images, 0 to disable')
+    parser.add_argument('--tile_overlap', type=float, default=0.2)
+    parser.add_argument('--tile_batch_size', type=int, default=8)
     parser.add_argument('--output_path', type=str, 
-                       default='./output/result.jpg')
+                       default='./output/result.jpg',
+                       help='Annotated images are written to the directory of this path')
+    parser.add_argument('--video_source', type=str, default='',
+                       help='Run on a video file, stream URL or camera index instead of images')
+    parser.add_argument('--frame_skip', type=int, default=0)
+    parser.add_argument('--render', type=str, default='async', choices=RENDER_MODES)
+    parser.add_argument('--image_format', type=str, default='jpg', choices=IMAGE_FORMATS)
+    parser.add_argument('--image_quality', type=int, default=95)
     return parser.parse_args()
 
-def run_yolo_detection(image_path, model_path, device, conf_threshold, iou_threshold, image_size, classes, output_path):
-    model = YOLO(model_path)
-    model.to(device)
-    
+def expand_image_paths(image_path):
+    """Expand an image file, a directory or a glob pattern into image files."""
+    if os.path.isdir(image_path):
+        paths = [os.path.join(image_path, name) for name in os.listdir(image_path)]
+    elif os.path.isfile(image_path):
+        return [image_path]
+    else:
+        paths = glob.glob(image_path)
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+
+def load_image(image_path):
     image = cv2.imread(image_path)
     if image is None:
         raise ValueError(f"Could not load image from {image_path}")
+    return image
 
-    class_indices = None
-    if classes:
-        try:
-            class_indices = [int(x) for x in classes.split(',')]
-        except ValueError:
-            print("Invalid class indices, using all classes")
-    
-    results = model(
-        image,
-        conf=conf_threshold,
-        iou=iou_threshold,
-        imgsz=image_size,
-        device=device,
-        classes=class_indices
-    )
-    
-    result = results[0]
-    
-    annotated_image = result.plot()
+def detect_image(session, image, tile_size=0, tile_overlap=0.2, tile_batch_size=8):
+    """Run detection on one image with an existing session.
+
+    Images larger than ``tile_size`` (when it is not 0) go through sliced
+    inference, see :meth:`YoloSession.predict_tiled`.
+
+    Returns:
+        DetectionResult: The detections, which can render the annotated
+        image on demand.
+    """
+    if isinstance(image, str):
+        image = load_image(image)
+    if tile_size and max(image.shape[:2]) > tile_size:
+        return session.predict_tiled(image, tile_size, tile_overlap, tile_batch_size)
+    return DetectionResult.from_yolo(session.infer(image), session.names)
+
+def render_digest(image, detections, fmt='', quality=0):
+    """Content digest of an annotated image, used to name its file."""
+    return content_digest(image, detections.xyxy, detections.conf,
+                          detections.cls, extra=f'{fmt}:{quality}')
+
+def resolve_output_dir(output_path):
+    """Use ``output_path`` itself, or its directory if it names a file."""
+    if not output_path:
+        return 'output'
+    if os.path.splitext(output_path)[1]:
+        return os.path.dirname(output_path) or '.'
+    return output_path
+
+def run_yolo_detection(image_path, model_path, device, conf_threshold, iou_threshold, image_size, classes, output_path, session=None):
+    """Run detection on one image and write the annotated image to
+    ``output_path``.
+
+    Pass a :class:`YoloSession` to reuse a loaded model, otherwise a
+    temporary session is created for this call.
+    """
+    if session is None:
+        with YoloSession(model_path, device, conf_threshold, iou_threshold,
+                         image_size, classes, warmup=False) as session:
+            return run_yolo_detection(image_path, model_path, device,
+                                      conf_threshold, iou_threshold, image_size,
+                                      classes, output_path, session=session)
+
+    detections = detect_image(session, image_path)
 
     output_dir = os.path.dirname(output_path)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
-    cv2.imwrite(output_path, annotated_image)
-
-    detections = []
-    for box in result.boxes:
-        detection = {
-            'class_id': int(box.cls.item()),
-            'class_name': model.names[int(box.cls.item())],
-            'confidence': float(box.conf.item()),
-            'bbox': {
-                'x1': int(box.xyxy[0][0].item()),
-                'y1': int(box.xyxy[0][1].item()),
-                'x2': int(box.xyxy[0][2].item()),
-                'y2': int(box.xyxy[0][3].item())
-            }
-        }
-        detections.append(detection)
-    
-    output = {
-        'detections': detections,
-        'image_path': output_path
-    }
-    
-    return json.dumps(output)
+    cv2.imwrite(output_path, detections.render())
+
+    return detections.to_json(image_path=output_path)
+
+class DetectionRenderer:
+    """Render detections according to a render mode.
+
+    Args:
+        mode (str): One of :data:`RENDER_MODES`. Defaults to 'none'.
+        output_dir (str): Where the async mode writes annotated images.
+            Defaults to 'output'.
+        image_format (str): Encoder format of annotated images.
+            Defaults to 'jpg'.
+        image_quality (int): Encoder quality. Defaults to 95.
+        writer_workers (int): Number of background writer threads.
+            Defaults to 2.
+        max_kept_results (int): How many recent results the on_demand mode
+            keeps for :meth:`render`, and the async mode keeps writes of for
+            :meth:`wait`. Defaults to 16.
+    """
+
+    def __init__(self,
+                 mode='none',
+                 output_dir='output',
+                 image_format='jpg',
+                 image_quality=95,
+                 writer_workers=2,
+                 max_kept_results=16):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode {mode}, expected one of {RENDER_MODES}")
+        self.mode = mode
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.max_kept_results = max_kept_results
+        self._kept = OrderedDict()
+        self._writes = OrderedDict()
+        self._writer = None
+        if mode == 'async':
+            self._writer = AsyncImageWriter(output_dir, image_format,
+                                            image_quality, writer_workers)
+
+    def __call__(self, image, detections):
+        """Return the detections, with ``image_path`` (async) or
+        ``render_id`` (on_demand) among their serialized fields."""
+        if self.mode == 'none':
+            return detections
+
+        digest = render_digest(image, detections, self.image_format, self.image_quality)
+        if self.mode == 'async':
+            output_path, future = self._writer.write(detections.render, digest)
+            self._writes[output_path] = future
+            self._writes.move_to_end(output_path)
+            while len(self._writes) > self.max_kept_results:
+                self._writes.popitem(last=False)
+            return detections.with_meta(image_path=output_path)
+
+        self._kept[digest] = detections
+        self._kept.move_to_end(digest)
+        while len(self._kept) > self.max_kept_results:
+            self._kept.popitem(last=False)
+        return detections.with_meta(render_id=digest)
+
+    def render(self, render_id):
+        """Render the annotated BGR image of a result kept in on_demand mode."""
+        if render_id not in self._kept:
+            raise KeyError(f"No detection result kept for {render_id}")
+        return self._kept[render_id].render()
+
+    def wait(self, image_path, timeout=None):
+        """Wait until an image of the async mode is written and return its
+        path; raises the error of a failed write."""
+        future = self._writes.get(image_path)
+        if future is None:
+            if os.path.exists(image_path):
+                return image_path
+            raise KeyError(f"No pending write for {image_path}")
+        return future.result(timeout)
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._kept.clear()
+        self._writes.clear()
 
 class YoloDetect(BaseTool):
     """A tool to detect objects using YOLO model."""
@@ -94,6 +213,14 @@ class YoloDetect(BaseTool):
                  image_size: int = 640,
                  classes: str = '',
                  output_path: str = '',
+                 max_batch_size: int = 1,
+                 batch_window_ms: float = 5.0,
+                 render: str = 'none',
+                 image_format: str = 'jpg',
+                 image_quality: int = 95,
+                 tile_size: int = 0,
+                 tile_overlap: float = 0.2,
+                 tile_batch_size: int = 8,
                  toolmeta=None):
         super().__init__(toolmeta=toolmeta)
         self.model_path = model_path
@@ -103,47 +230,166 @@ class YoloDetect(BaseTool):
         self.image_size = image_size
         self.classes = classes
         self.output_path = output_path
-        self.model = YOLO(self.model_path)
-        self.model.to(self.device)
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+        self.render_mode = render
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_batch_size = tile_batch_size
+        self.session = None
+        self.renderer = None
+        self.setup()
+
+    def setup(self):
+        if self.session is None:
+            self.session = YoloSession(
+                self.model_path,
+                device=self.device,
+                conf_threshold=self.conf_threshold,
+                iou_threshold=self.iou_threshold,
+                image_size=self.image_size,
+                classes=self.classes,
+                max_batch_size=self.max_batch_size,
+                batch_window_ms=self.batch_window_ms)
+        if self.renderer is None:
+            self.renderer = DetectionRenderer(
+                self.render_mode,
+                output_dir=resolve_output_dir(self.output_path),
+                image_format=self.image_format,
+                image_quality=self.image_quality)
+
+    def teardown(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+
+    @property
+    def model(self):
+        self.setup()
+        return self.session.model
         
-    def apply(self, image: ImageIO) -> Annotated[str, Info('Detection results with object names, confidence and bounding boxes.')]:
+    def apply(self, image: ImageIO) -> Annotated[DetectionResult, Info('Detection results with object names, confidence and bounding boxes.')]:
         """Apply YOLO detection to the image.
         
         Args:
             image (ImageIO): Input image
             
         Returns:
-            str: Detection results in JSON format with object names, confidence and bounding boxes
+            DetectionResult: Detection results with object names, confidence and bounding boxes;
+                ``str()`` gives them in JSON format. With ``render='async'`` they also hold the
+                ``image_path`` the annotated image is written to, with ``render='on_demand'`` a
+                ``render_id`` for :meth:`render`.
         """
-        image_path = image.image_path
-        result = run_yolo_detection(
-            image_path=image_path,
-            model_path=self.model_path,
-            device=self.device,
-            conf_threshold=self.conf_threshold,
-            iou_threshold=self.iou_threshold,
-            image_size=self.image_size,
-            classes=self.classes,
-            output_path=self.output_path
-        )
+        self.setup()
+        # Cached decode shared with the other tools given the same ImageIO
+        image_array = image.to_bgr()
+        detections = detect_image(self.session, image_array, self.tile_size,
+                                  self.tile_overlap, self.tile_batch_size)
+        if image.reduction > 1:
+            # Decoded at a reduced size (ImageIO target_size): report boxes
+            # in full resolution coordinates
+            detections = detections.with_boxes(image.to_original(detections.xyxy))
         
-        return result
+        return self.renderer(image_array, detections)
+
+    def apply_stream(self, source, frame_skip: int = 0, batch_size: int = 1,
+                     queue_size: int = 4, realtime: bool = False):
+        """Detect objects in a video file, stream URL, camera index or an
+        iterable of BGR frames.
+
+        Decoding, inference and result encoding run as pipelined threads
+        connected by bounded queues, see :class:`VideoPipeline`.
+
+        Args:
+            source (str | int | Iterable): The video source.
+            frame_skip (int): Frames dropped after each processed one.
+                Defaults to 0.
+            batch_size (int): Maximum frames per forward pass. Defaults to 1.
+            queue_size (int): Capacity of the inter-stage queues.
+                Defaults to 4.
+            realtime (bool): Drop frames instead of blocking the decoder when
+                inference falls behind. Defaults to False.
+
+        Returns:
+            VideoPipeline: Iterating it yields ``(frame index, frame, result)``
+            where result is the serialized detections, and its ``stats()``
+            reports per-stage FPS.
+        """
+        self.setup()
+        session, renderer = self.session, self.renderer
+        return VideoPipeline(
+            source,
+            infer_fn=session.predict,
+            encode_fn=lambda frame, result: renderer(
+                frame, DetectionResult.from_yolo(result, session.names)).to_json(),
+            frame_skip=frame_skip,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            realtime=realtime)
+
+    def render(self, render_id):
+        """Render the annotated image of a result returned in on_demand mode.
+
+        Returns:
+            np.ndarray: The annotated image in BGR format.
+        """
+        self.setup()
+        return self.renderer.render(render_id)
+
+def run_video(args):
+    tool = YoloDetect(model_path=args.model_path,
+                      device=args.device,
+                      conf_threshold=args.conf_threshold,
+                      iou_threshold=args.iou_threshold,
+                      image_size=args.image_size,
+                      classes=args.classes,
+                      output_path=args.output_path,
+                      render=args.render,
+                      image_format=args.image_format,
+                      image_quality=args.image_quality)
+    source = int(args.video_source) if args.video_source.isdigit() else args.video_source
+    pipeline = tool.apply_stream(source, frame_skip=args.frame_skip)
+    try:
+        for index, _, result in pipeline:
+            print(index, result)
+    finally:
+        # Also stop the batcher and writer threads when the stream fails
+        tool.teardown()
+    print(json.dumps(pipeline.stats()))
 
 def main():
     args = parse_args()
     
-    result = run_yolo_detection(
-        image_path=args.image_path,
-        model_path=args.model_path,
-        device=args.device,
-        conf_threshold=args.conf_threshold,
-        iou_threshold=args.iou_threshold,
-        image_size=args.image_size,
-        classes=args.classes,
-        output_path=args.output_path
-    )
-    
-    print(result)
+    if args.video_source:
+        return run_video(args)
+
+    image_paths = expand_image_paths(args.image_path)
+    if not image_paths:
+        raise ValueError(f"No images found at {args.image_path}")
+
+    renderer = DetectionRenderer(args.render,
+                                 output_dir=resolve_output_dir(args.output_path),
+                                 image_format=args.image_format,
+                                 image_quality=args.image_quality)
+
+    # Load the model once and reuse it for every image
+    with YoloSession(args.model_path,
+                     device=args.device,
+                     conf_threshold=args.conf_threshold,
+                     iou_threshold=args.iou_threshold,
+                     image_size=args.image_size,
+                     classes=args.classes) as session:
+        for image_path in image_paths:
+            image = load_image(image_path)
+            detections = detect_image(session, image, args.tile_size,
+                                      args.tile_overlap, args.tile_batch_size)
+            print(renderer(image, detections))
+    renderer.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,4 +1,6 @@
 from .base import BaseTool
 from .registry import register_tool, get_tool_cls, list_tools, load_tool
+from .pool import ToolPool, acquire_tool, configure_tool_pool, get_tool_pool
 
-__all__ = ['BaseTool', 'register_tool', 'get_tool_cls', 'list_tools', 'load_tool']
\ No newline at end of file
+__all__ = ['BaseTool', 'register_tool', 'get_tool_cls', 'list_tools', 'load_tool',
+           'ToolPool', 'acquire_tool', 'configure_tool_pool', 'get_tool_pool']
\ No newline at end of file
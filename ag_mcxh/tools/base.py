@@ -19,6 +19,10 @@ class BaseTool(ABC):
         """工具初始化方法"""
         pass
     
+    def teardown(self):
+        """释放 setup 中获取的共享资源"""
+        pass
+    
     @abstractmethod
     def apply(self, *args, **kwargs):
         """工具应用方法"""
@@ -1,7 +1,11 @@
 from .base import BaseTool
 from .registry import register_tool
-from typing import Any
+from ..types.detection import DetectionResult
+from ..types.io_types import ImageIO
+from ..utils.batching import MicroBatcher
+from typing import Any, Union
 import os
+import threading
 
 @register_tool("YoloDetect")
 class YoloDetect(BaseTool):
@@ -15,50 +19,75 @@ class YoloDetect(BaseTool):
                  model_path: str = "yolo11n.pt",
                  device: str = "cpu",
                  conf_threshold: float = 0.5,
+                 max_batch_size: int = 1,
+                 batch_window_ms: float = 5.0,
                  **kwargs):
         super().__init__(**kwargs)
         self.model_name = model_name
         self.model_path = model_path
         self.device = device
         self.conf_threshold = conf_threshold
+        # 并发请求在 batch_window_ms 内合并为一次前向推理，1 表示不合并
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
         self._model = None
+        self._batcher = None
+        # 工具实例由工具池在并发请求间共享：ultralytics 预测器不是线程安全的，
+        # 懒加载与未合并批次的推理都在此锁内进行
+        self._lock = threading.Lock()
         
     def setup(self):
+        with self._lock:
+            if self._model is None:
+                self._setup()
+
+    def _setup(self):
         try:
-            from ..models.registry import load_model
-            model_cls = load_model(self.model_name)
+            from ..models.registry import get_model_cls
+            model_cls = get_model_cls(self.model_name)
             self._model = model_cls(self.model_path)
             self._model.to(self.device)
         except Exception as e:
             raise RuntimeError(f"Failed to load model {self.model_name}: {str(e)}")
+        if self.max_batch_size > 1:
+            self._batcher = MicroBatcher(
+                self._predict_batch,
+                max_batch_size=self.max_batch_size,
+                max_wait_ms=self.batch_window_ms,
+                name='YoloDetectBatcher')
+    
+    def teardown(self):
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
+        self._model = None
     
-    def apply(self, image_path: str) -> str:
+    def _predict_batch(self, sources):
+        return self._model(list(sources), conf=self.conf_threshold, verbose=False)
+    
+    def apply(self, image: Union[str, ImageIO]) -> DetectionResult:
         if self._model is None:
             self.setup()
             
-        if not os.path.exists(image_path):
-            return f"Error: Image file not found {image_path}"
+        if isinstance(image, ImageIO):
+            # 直接使用已解码的 BGR 数组，避免再次读盘解码
+            source = image.to_bgr()
+        elif not os.path.exists(image):
+            raise FileNotFoundError(f"Image file not found {image}")
+        else:
+            source = image
             
-        try:
-            results = self._model(image_path, conf=self.conf_threshold)
+        if self._batcher is not None:
+            result = self._batcher(source)
+        else:
+            with self._lock:
+                results = self._model(source, conf=self.conf_threshold)
             result = results[0]
-            
-            detections = []
-            if result.boxes is not None:
-                for box in result.boxes:
-                    detection = {
-                        'class_id': int(box.cls.item()),
-                        'class_name': result.names[int(box.cls.item())],
-                        'confidence': float(box.conf.item()),
-                        'bbox': {
-                            'x1': int(box.xyxy[0][0].item()),
-                            'y1': int(box.xyxy[0][1].item()),
-                            'x2': int(box.xyxy[0][2].item()),
-                            'y2': int(box.xyxy[0][3].item())
-                        }
-                    }
-                    detections.append(detection)
-            
-            return str(detections)
-        except Exception as e:
-            return f"Detection failed: {str(e)}"
\ No newline at end of file
+        
+        detections = DetectionResult.from_yolo(result)
+        if isinstance(image, ImageIO) and image.reduction > 1:
+            # 按缩小尺寸解码时，将检测框映射回原图坐标
+            detections = detections.with_boxes(image.to_original(detections.xyxy))
+        
+        # str(detections) 为 JSON 文本
+        return detections
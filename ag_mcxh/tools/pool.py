@@ -0,0 +1,314 @@
+import inspect
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+from ..utils import freeze_arguments
+from .base import BaseTool
+from .registry import get_tool_cls
+
+
+def tensor_sizes(obj: Any, max_depth: int = 3) -> Dict[int, int]:
+    """找出对象持有的模型权重与数组，返回 ``{id(数组): 字节数}``
+
+    遍历对象属性，收集 ``torch.nn.Module`` 的参数/缓冲区、``Tensor`` 以及
+    ``np.ndarray``。以 id 为键，多个工具通过对象缓存共享的权重只计一次。
+    """
+    seen = set()
+    sizes = {}
+
+    def _walk(value, depth):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+
+        if hasattr(value, 'nbytes') and hasattr(value, 'shape'):
+            sizes[id(value)] = int(value.nbytes)
+            return
+        if hasattr(value, 'element_size') and hasattr(value, 'numel'):
+            sizes[id(value)] = int(value.element_size() * value.numel())
+            return
+        if callable(getattr(value, 'parameters', None)) and \
+                callable(getattr(value, 'buffers', None)):
+            try:
+                for tensor in list(value.parameters()) + list(value.buffers()):
+                    _walk(tensor, depth)
+                return
+            except TypeError:
+                pass
+
+        if depth >= max_depth or inspect.ismodule(value) or \
+                inspect.isclass(value) or inspect.isroutine(value):
+            return
+        if isinstance(value, dict):
+            children = value.values()
+        elif isinstance(value, (list, tuple, set)):
+            children = value
+        elif hasattr(value, '__dict__'):
+            children = vars(value).values()
+        else:
+            return
+        for child in children:
+            _walk(child, depth + 1)
+
+    _walk(obj, 0)
+    return sizes
+
+
+def estimate_nbytes(obj: Any, max_depth: int = 3) -> int:
+    """估算对象持有的模型权重与数组占用的内存（字节），无法识别的对象按 0 计算"""
+    return sum(tensor_sizes(obj, max_depth).values())
+
+
+class _PoolEntry:
+    """池内的一个工具实例及其租约计数"""
+
+    __slots__ = ('tool', 'sizes', 'leases', 'evicted')
+
+    def __init__(self, tool: BaseTool, sizes: Dict[int, int]):
+        self.tool = tool
+        # 池内工具存活期间其权重不会被回收，id 保持唯一
+        self.sizes = sizes
+        self.leases = 0
+        self.evicted = False
+
+
+class ToolLease:
+    """工具实例的租约
+
+    持有期间工具不会被 teardown：被淘汰的工具要等最后一个租约释放后才会
+    teardown。可作为上下文管理器使用（``with`` 返回工具本身），也可直接
+    当作工具调用其方法；未显式 ``release`` 的租约在被回收时释放。
+    """
+
+    def __init__(self, pool: 'ToolPool', entry: _PoolEntry):
+        self._pool = pool
+        self._entry = entry
+        self.tool = entry.tool
+
+    def release(self):
+        """释放租约，重复调用无效果"""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry)
+
+    def __enter__(self) -> BaseTool:
+        return self.tool
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['tool'], name)
+
+    def __del__(self):
+        if self.__dict__.get('_entry') is not None:
+            self.release()
+
+
+class ToolPool:
+    """进程级工具实例池
+
+    以 ``(工具名, 规范化后的构造参数)`` 为键缓存已完成 ``setup`` 的工具实例，
+    按 LRU 顺序在超出内存预算或数量上限时淘汰。``get`` 返回 :class:`ToolLease`，
+    正在使用的工具被淘汰时延迟到租约全部释放后再 teardown；teardown 均在池锁
+    之外执行，不会阻塞其他线程获取工具。
+
+    Args:
+        max_bytes (int, optional): 池内工具允许占用的内存上限（字节），
+            ``None`` 表示不限制。
+        max_items (int, optional): 池内最多保留的工具实例数，``None`` 表示不限制。
+    """
+
+    def __init__(self,
+                 max_bytes: Optional[int] = None,
+                 max_items: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._tools: 'OrderedDict[Hashable, _PoolEntry]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(name: str, **kwargs) -> Hashable:
+        """生成池键，构造参数会补全默认值并与传参顺序无关"""
+        tool_cls = get_tool_cls(name)
+        arguments = dict(kwargs)
+        try:
+            bound = inspect.signature(tool_cls).bind(**kwargs)
+            bound.apply_defaults()
+            arguments = {}
+            for param_name, value in bound.arguments.items():
+                param = bound.signature.parameters[param_name]
+                if param.kind is inspect.Parameter.VAR_KEYWORD:
+                    arguments.update(value)
+                else:
+                    arguments[param_name] = value
+        except (TypeError, ValueError):
+            pass
+        return name, freeze_arguments(arguments)
+
+    def _lease(self, key: Hashable) -> Optional[ToolLease]:
+        # 需持有 self._lock
+        entry = self._tools.get(key)
+        if entry is None:
+            return None
+        self._tools.move_to_end(key)
+        self.hits += 1
+        entry.leases += 1
+        return ToolLease(self, entry)
+
+    def get(self, name: str, **kwargs) -> ToolLease:
+        """获取工具实例的租约，未命中时构造并完成 setup 后放入池中"""
+        key = self.make_key(name, **kwargs)
+        with self._lock:
+            lease = self._lease(key)
+            if lease is not None:
+                return lease
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            try:
+                # 其他线程可能已经构造完成
+                with self._lock:
+                    lease = self._lease(key)
+                    if lease is not None:
+                        return lease
+                    self.misses += 1
+
+                tool = get_tool_cls(name)(**kwargs)
+                if not tool._is_setup:
+                    tool.setup()
+                    tool._is_setup = True
+                entry = _PoolEntry(tool, tensor_sizes(tool))
+                entry.leases = 1
+
+                with self._lock:
+                    self._tools[key] = entry
+                    evicted = self._evict()
+            finally:
+                # 构造或 setup 失败时同样清理键锁
+                with self._lock:
+                    self._key_locks.pop(key, None)
+        self._teardown_all(evicted)
+        return ToolLease(self, entry)
+
+    def _release(self, entry: _PoolEntry):
+        with self._lock:
+            entry.leases -= 1
+            teardown = entry.evicted and entry.leases == 0
+        if teardown:
+            self._teardown(entry.tool)
+
+    def _evict(self) -> List[BaseTool]:
+        """按 LRU 淘汰超出预算的工具，需持有 self._lock
+
+        返回可以立即 teardown 的工具，由调用方在锁外执行；仍被租用的工具
+        只做标记，等最后一个租约释放时 teardown。
+        """
+        idle = []
+        # 最近放入的工具单独超出预算时仍然保留，避免每次请求都重新加载
+        while len(self._tools) > 1 and self._over_budget():
+            _, entry = self._tools.popitem(last=False)
+            idle.extend(self._retire(entry))
+        return idle
+
+    def _retire(self, entry: _PoolEntry) -> List[BaseTool]:
+        self.evictions += 1
+        entry.evicted = True
+        return [entry.tool] if entry.leases == 0 else []
+
+    def _teardown_all(self, tools: List[BaseTool]):
+        for tool in tools:
+            self._teardown(tool)
+
+    @staticmethod
+    def _teardown(tool: BaseTool):
+        if tool._is_setup:
+            tool.teardown()
+            tool._is_setup = False
+
+    def _over_budget(self) -> bool:
+        if self.max_items is not None and len(self._tools) > self.max_items:
+            return True
+        if self.max_bytes is not None and self.nbytes > self.max_bytes:
+            return True
+        return False
+
+    @property
+    def nbytes(self) -> int:
+        """池内工具估算的总内存占用（字节），共享的权重只计一次"""
+        sizes = {}
+        for entry in self._tools.values():
+            sizes.update(entry.sizes)
+        return sum(sizes.values())
+
+    def configure(self,
+                  max_bytes: Optional[int] = None,
+                  max_items: Optional[int] = None):
+        """调整池容量，仅更新传入的限制，超出新限制的工具会立即被淘汰"""
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if max_items is not None:
+                self.max_items = max_items
+            evicted = self._evict()
+        self._teardown_all(evicted)
+
+    def evict(self, name: str, **kwargs) -> bool:
+        """显式淘汰指定工具实例，返回是否存在该实例"""
+        key = self.make_key(name, **kwargs)
+        with self._lock:
+            entry = self._tools.pop(key, None)
+            if entry is None:
+                return False
+            evicted = self._retire(entry)
+        self._teardown_all(evicted)
+        return True
+
+    def clear(self):
+        """清空工具池"""
+        with self._lock:
+            evicted = []
+            for entry in self._tools.values():
+                evicted.extend(self._retire(entry))
+            self._tools.clear()
+        self._teardown_all(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中、未命中、淘汰次数以及当前占用"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._tools),
+                'in_use': sum(1 for entry in self._tools.values() if entry.leases),
+                'nbytes': self.nbytes,
+            }
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+
+_TOOL_POOL = ToolPool()
+
+
+def get_tool_pool() -> ToolPool:
+    """获取进程级工具池"""
+    return _TOOL_POOL
+
+
+def configure_tool_pool(max_bytes: Optional[int] = None,
+                        max_items: Optional[int] = None) -> ToolPool:
+    """配置进程级工具池的内存预算与数量上限"""
+    _TOOL_POOL.configure(max_bytes=max_bytes, max_items=max_items)
+    return _TOOL_POOL
+
+
+def acquire_tool(name: str, **kwargs) -> ToolLease:
+    """从进程级工具池中获取工具实例的租约，用完后 ``release`` 或使用 ``with``"""
+    return _TOOL_POOL.get(name, **kwargs)
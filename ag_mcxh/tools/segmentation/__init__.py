@@ -1,3 +1,4 @@
+from .sam_session import SamSessionManager
 from .segment_anything import SegmentAnything, SegmentObject
 
-__all__ = ['SegmentAnything', 'SegmentObject']
\ No newline at end of file
+__all__ = ['SegmentAnything', 'SegmentObject', 'SamSessionManager']
\ No newline at end of file
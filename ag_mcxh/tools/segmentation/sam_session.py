@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+from ...models.sam import read_sam_image
+from ...types import ImageIO
+
+
+class SamSession:
+    """Image embedding and last low resolution mask of one interactive
+    segmentation session."""
+
+    __slots__ = ('session_id', 'features', 'low_res_mask', 'last_used', 'nbytes')
+
+    def __init__(self, session_id: str, features: Dict[str, Any]):
+        self.session_id = session_id
+        self.features = features
+        self.low_res_mask = None
+        self.last_used = time.monotonic()
+        tensor = features['features']
+        self.nbytes = tensor.element_size() * tensor.numel() \
+            if hasattr(tensor, 'element_size') else int(tensor.nbytes)
+
+
+class SamSessionManager:
+    """Click-to-segment sessions: encode an image once, then run only the
+    mask decoder for every prompt.
+
+    Sessions expire ``ttl`` seconds after their last use, and the least
+    recently used ones are closed when their embeddings exceed
+    ``max_bytes``.
+
+    Args:
+        predictor (SamPredictor): The predictor of
+            ``tools.segmentation.segment_anything``.
+        ttl (float): Idle seconds before a session expires. Defaults to 600.
+        max_bytes (int): Memory budget of the session embeddings.
+            Defaults to 512 MiB.
+    """
+
+    def __init__(self, predictor, ttl: float = 600.0, max_bytes: int = 512 << 20):
+        self.predictor = predictor
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions: 'OrderedDict[str, SamSession]' = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def open_session(self, image: Union[str, np.ndarray, ImageIO],
+                     image_format: str = 'RGB') -> str:
+        """Encode an image and return the id of its session.
+
+        Args:
+            image (str | np.ndarray | ImageIO): An image file (read as BGR),
+                an HWC uint8 array, or an ImageIO.
+            image_format (str): Channel order of an array image.
+        """
+        image, image_format = read_sam_image(image, image_format)
+        features = self.predictor.set_image(image, image_format)
+        session = SamSession(uuid.uuid4().hex, features)
+        with self._lock:
+            self._expire()
+            self._sessions[session.session_id] = session
+            self._nbytes += session.nbytes
+            while self._nbytes > self.max_bytes and len(self._sessions) > 1:
+                self._drop(next(iter(self._sessions)))
+        return session.session_id
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._nbytes -= session.nbytes
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id in [s.session_id for s in self._sessions.values()
+                           if now - s.last_used > self.ttl]:
+            self._drop(session_id)
+
+    def _get(self, session_id: str) -> SamSession:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise KeyError(f'Unknown or expired session {session_id}')
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def predict(self,
+                session_id: str,
+                point_coords: Optional[np.ndarray] = None,
+                point_labels: Optional[np.ndarray] = None,
+                box: Optional[np.ndarray] = None,
+                mask_input: Optional[np.ndarray] = None,
+                multimask_output: bool = True,
+                use_previous_mask: bool = True,
+                upscale: bool = True):
+        """Predict masks for new prompts on the session image.
+
+        Only the prompt encoder and mask decoder run. Unless ``mask_input``
+        is given, the best low resolution mask of the previous call is fed
+        back, so successive clicks refine the same object.
+
+        Returns:
+            tuple: The masks, their scores and low resolution logits, as
+            returned by ``SamPredictor.predict``.
+        """
+        session = self._get(session_id)
+        if mask_input is None and use_previous_mask:
+            mask_input = session.low_res_mask
+        masks, scores, low_res = self.predictor.predict(
+            session.features,
+            point_coords=point_coords,
+            point_labels=point_labels,
+            box=box,
+            mask_input=mask_input,
+            multimask_output=multimask_output,
+            upscale=upscale)
+        session.low_res_mask = low_res[np.argmax(scores)][None]
+        return masks, scores, low_res
+
+    def reset(self, session_id: str):
+        """Forget the previous mask, e.g. to start a new object."""
+        self._get(session_id).low_res_mask = None
+
+    def close_session(self, session_id: str):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            return {
+                'sessions': len(self._sessions),
+                'nbytes': self._nbytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+            }
@@ -1,13 +1,24 @@
+import functools
+import os
 import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import TYPE_CHECKING, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
 
 import numpy as np
 from PIL import Image
 
-from ...types import Annotated, ImageIO, Info
+from ...models.sam import infer_sam_variant, load_sam
+from ...types import Annotated, ImageIO, Info, LowResMasks, MaskResult, RLEMask
 from ...utils import (download_checkpoint, download_url_to_file,
-                      is_package_available, load_or_build_object, require)
+                      freeze_arguments, is_package_available,
+                      load_or_build_object, release_object, require)
+from ...utils.batching import MicroBatcher
+from ...utils.embedding_cache import (EmbeddingCache, get_embedding_cache,
+                                      sam_model_id, set_image_cached)
+from ...utils.images_utils import label_palette, overlay_masks
 from ...tools.base import BaseTool
 
 if is_package_available('torch'):
@@ -18,52 +29,157 @@ else:
     Tensor = None
 
 GLOBAL_SEED = 1912
+# Minimum number of threads encoding images for SegmentObject while the
+# grounding model runs, as ThreadPoolExecutor sizes its default pool
+ENCODER_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Settings of ``SamAutomaticMaskGenerator`` for ``SegmentAnything``.
+#   default: the upstream defaults, a 32x32 point grid on the full image.
+#   fast:    a 16x16 grid, i.e. 4x fewer decoder prompts, with slightly
+#            looser filters to keep recall. Together with the embedding
+#            cache, repeated images skip the encoder too. points_per_batch
+#            is kept at 64: upstream upscales every batch to 1024x1024, so
+#            larger batches mostly cost memory.
+#   quality: adds one layer of zoomed-in crops and removes small holes and
+#            islands; several times slower than default.
+MASK_GENERATOR_PRESETS = {
+    'default': dict(
+        points_per_side=32,
+        points_per_batch=64,
+        pred_iou_thresh=0.88,
+        stability_score_thresh=0.95,
+        crop_n_layers=0,
+        crop_n_points_downscale_factor=1,
+        min_mask_region_area=0),
+    'fast': dict(
+        points_per_side=16,
+        points_per_batch=64,
+        pred_iou_thresh=0.86,
+        stability_score_thresh=0.92,
+        crop_n_layers=0,
+        crop_n_points_downscale_factor=1,
+        min_mask_region_area=0),
+    'quality': dict(
+        points_per_side=32,
+        points_per_batch=64,
+        pred_iou_thresh=0.88,
+        stability_score_thresh=0.95,
+        crop_n_layers=1,
+        crop_n_points_downscale_factor=2,
+        min_mask_region_area=100),
+}
+
+
+def mask_generator_config(preset: str = 'default', **overrides) -> dict:
+    """Settings of a preset in ``MASK_GENERATOR_PRESETS``, with overrides."""
+    if preset not in MASK_GENERATOR_PRESETS:
+        raise ValueError(f'Unknown preset {preset}, expected one of '
+                         f'{list(MASK_GENERATOR_PRESETS)}')
+    return {**MASK_GENERATOR_PRESETS[preset], **overrides}
+
+
+@functools.lru_cache()
+def _cached_predictor_cls():
+    from segment_anything import SamPredictor as _SamPredictor
+
+    class CachedSamPredictor(_SamPredictor):
+        """Upstream stateful predictor taking embeddings from the cache."""
+
+        def set_image(self, image, image_format='RGB'):
+            set_image_cached(self, image, image_format,
+                             set_image=super().set_image)
+
+    return CachedSamPredictor
+
+
+def build_mask_generator(sam, **config):
+    """Build a ``SamAutomaticMaskGenerator`` producing RLE masks.
+
+    Its predictor reads image embeddings from the shared embedding cache,
+    and ``generator.lock`` serializes calls, since the predictor is stateful.
+    """
+    from segment_anything import SamAutomaticMaskGenerator
 
+    generator = SamAutomaticMaskGenerator(
+        sam, output_mode='uncompressed_rle', **config)
+    generator.predictor = _cached_predictor_cls()(sam)
+    generator.lock = threading.Lock()
+    return generator
 
-def load_sam_and_predictor(model, device=None, ckpt_path=None):
 
-    def _load_sam(model, ckpt_path, device):
-        try:
-            from segment_anything import sam_model_registry
-        except ImportError as e:
-            raise ImportError(
-                f'Failed to run the tool for {e}, please check if you have '
-                'install `segment_anything` correctly')
-
-        url = f'https://dl.fbaipublicfiles.com/segment_anything/{model}'
-        if ckpt_path is not None:
-            Path(ckpt_path).parent.mkdir(exist_ok=True, parents=True)
-            download_url_to_file(url, ckpt_path)
-        else:
-            ckpt_path = download_checkpoint(url)
+def _resolve_sam_checkpoint(model, ckpt_path=None):
+    url = f'https://dl.fbaipublicfiles.com/segment_anything/{model}'
+    if ckpt_path is not None:
+        Path(ckpt_path).parent.mkdir(exist_ok=True, parents=True)
+        download_url_to_file(url, ckpt_path)
+    else:
+        ckpt_path = download_checkpoint(url)
+    return ckpt_path
 
-        sam = sam_model_registry['vit_h'](checkpoint=ckpt_path)
-        sam.to(device=device)
-        return sam
 
-    def _load_sam_predictor(sam):
-        return SamPredictor(sam)
+def load_sam_and_predictor(model, device=None, ckpt_path=None,
+                           max_batch_size=1, batch_window_ms=5.0):
+    """Load the SAM model and its predictor from the shared object cache.
 
-    sam = load_or_build_object(_load_sam, model, ckpt_path, device)
-    sam_predictor = load_or_build_object(_load_sam_predictor, sam)
+    Every tool asking for the same checkpoint on the same device gets the
+    same weights. Call :func:`release_sam_and_predictor` when done.
+    """
+    ckpt_path = _resolve_sam_checkpoint(model, ckpt_path)
+    sam = load_sam(infer_sam_variant(model, default='vit_h'), ckpt_path, device)
+    sam_predictor = load_or_build_object(
+        SamPredictor, sam, max_batch_size=max_batch_size,
+        batch_window_ms=batch_window_ms)
     return sam, sam_predictor
 
 
+def release_sam_and_predictor(sam, sam_predictor):
+    """Release the references taken by :func:`load_sam_and_predictor`."""
+    release_object(sam_predictor)
+    release_object(sam)
+
+
+def _take(prompts, index):
+    if prompts is None or index is None:
+        return prompts
+    return prompts[index]
+
+
 class SamPredictor:
 
     @require(('torch', 'segment_anything'))
     def __init__(
         self,
         sam_model,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        max_batch_size: int = 1,
+        batch_window_ms: float = 5.0,
     ) -> None:
         """Uses SAM to calculate the image embedding for an image, and then
         allow repeated, efficient mask prediction given prompts.
 
         Arguments:
           sam_model (Sam): The model to use for mask prediction.
+          embedding_cache (EmbeddingCache or None): Where image embeddings
+            are cached by image content. Defaults to the process-wide cache.
+          max_batch_size (int): Maximum number of images from concurrent
+            set_image calls encoded in one forward. 1 disables batching.
+          batch_window_ms (float): How long the encoder waits for more
+            images once the first one arrived, in milliseconds.
         """
         super().__init__()
         self.model = sam_model
+        self.model_id = sam_model_id(sam_model)
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        self._encoder_batcher = None
+        if max_batch_size > 1:
+            # The worker only holds a weak reference, so the predictor can
+            # still be collected once released
+            ref = weakref.ref(self)
+            self._encoder_batcher = MicroBatcher(
+                lambda images: ref()._encode_batch(images),
+                max_batch_size=max_batch_size,
+                max_wait_ms=batch_window_ms,
+                name='SamEncoderBatcher')
 
         from segment_anything.utils.transforms import ResizeLongestSide
 
@@ -73,27 +189,56 @@ class SamPredictor:
         self,
         image: np.ndarray,
         image_format: str = 'RGB',
+        use_cache: bool = True,
     ) -> None:
         """Calculates the image embeddings for the provided image, allowing
         masks to be predicted with the 'predict' method.
 
+        Embeddings are looked up in the embedding cache first, by a hash of
+        the image content and the model, so prompting the same image again
+        only runs the mask decoder.
+
         Arguments:
-          image (np.ndarray): The image for calculating masks. Expects an
-            image in HWC uint8 format, with pixel values in [0, 255].
+          image (np.ndarray or ImageIO): The image for calculating masks.
+            Expects an image in HWC uint8 format, with pixel values in
+            [0, 255]. An ImageIO is read in the model channel order, and
+            its resized input is kept with the image for other callers.
           image_format (str): The color format of the image, in ['RGB', 'BGR'].
+          use_cache (bool): Whether to use the embedding cache.
         """
         assert image_format in [
             'RGB',
             'BGR',
         ], f"image_format must be in ['RGB', 'BGR'], is {image_format}."
+        source = None
+        if isinstance(image, ImageIO):
+            source = image
+            image_format = self.model.image_format
+            image = source.to_array(image_format)
+        if use_cache:
+            key = self.embedding_cache.make_key(image, self.model_id, image_format)
+            res = self.embedding_cache.get(key, device=self.device)
+            if res is not None:
+                res['features'] = res['features'].to(self.device)
+                return res
+            res = self.set_image(source or image, image_format, use_cache=False)
+            self.embedding_cache.put(key, res)
+            return res
+
         if image_format != self.model.image_format:
             image = image[..., ::-1]
 
         # Transform the image to the form expected by the model
-        input_image = self.transform.apply_image(image)
-        input_image_torch = torch.as_tensor(input_image, device=self.device)
-        input_image_torch = input_image_torch.permute(2, 0,
-                                                      1).contiguous()[None, :, :, :]
+        if source is not None:
+            input_image = source.derived(
+                ('sam_resize', self.transform.target_length, image_format),
+                lambda: self.transform.apply_image(image))
+        else:
+            input_image = self.transform.apply_image(image)
+        # HWC -> CHW in one host copy, which also leaves a shared view read-only
+        input_image_torch = torch.as_tensor(
+            np.ascontiguousarray(input_image.transpose(2, 0, 1)),
+            device=self.device)[None, :, :, :]
 
         return self.set_torch_image(input_image_torch, image.shape[:2])
 
@@ -120,8 +265,12 @@ class SamPredictor:
 
         original_size = original_image_size
         input_size = tuple(transformed_image.shape[-2:])
-        input_image = self.model.preprocess(transformed_image)
-        features = self.model.image_encoder(input_image)
+        with torch.no_grad():
+            input_image = self.model.preprocess(transformed_image)
+            if self._encoder_batcher is not None:
+                features = self._encoder_batcher(input_image[0])[None]
+            else:
+                features = self.model.image_encoder(input_image)
 
         res = {
             'features': features,
@@ -139,6 +288,7 @@ class SamPredictor:
         mask_input: Optional[np.ndarray] = None,
         multimask_output: bool = True,
         return_logits: bool = False,
+        upscale: bool = True,
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """Predict masks for the given input prompts, using the currently set
         image.
@@ -163,10 +313,13 @@ class SamPredictor:
             results.
           return_logits (bool): If true, returns un-thresholded masks logits
             instead of a binary mask.
+          upscale (bool): If false, the masks are returned as LowResMasks,
+            upscaled only when and where the caller needs pixels.
 
         Returns:
-          (np.ndarray): The output masks in CxHxW format, where C is the
-            number of masks, and (H, W) is the original image size.
+          (np.ndarray or LowResMasks): The output masks in CxHxW format,
+            where C is the number of masks, and (H, W) is the original
+            image size.
           (np.ndarray): An array of length C containing the model's
             predictions for the quality of each mask.
           (np.ndarray): An array of shape CxHxW, where C is the number
@@ -177,41 +330,128 @@ class SamPredictor:
             raise RuntimeError('An image must be set with .set_image(...)'
                                ' before mask prediction.')
 
-        # Transform input prompts
+        masks, iou_predictions, low_res_masks = self.predict_batch(
+            features,
+            point_coords=None if point_coords is None else [point_coords],
+            point_labels=None if point_labels is None else [point_labels],
+            boxes=None if box is None else np.asarray(box).reshape(1, 4),
+            mask_input=None if mask_input is None else mask_input[None],
+            multimask_output=multimask_output,
+            return_logits=return_logits,
+            upscale=upscale,
+        )
+        return masks[0], iou_predictions[0], low_res_masks[0]
+
+    def predict_batch(
+        self,
+        features,
+        point_coords: Optional[Sequence[np.ndarray]] = None,
+        point_labels: Optional[Sequence[np.ndarray]] = None,
+        boxes: Optional[np.ndarray] = None,
+        mask_input: Optional[np.ndarray] = None,
+        multimask_output: bool = True,
+        return_logits: bool = False,
+        upscale: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Predict masks for B prompt sets at once, using the currently set
+        image. All prompts go through one prompt encoder and mask decoder
+        pass, and the results are moved to the host once.
+
+        Arguments:
+          point_coords (sequence of np.ndarray or None): B arrays of point
+            prompts, each Nx2 in (X,Y) pixels. N may differ between prompt
+            sets; sets with the same N share one decoder pass.
+          point_labels (sequence of np.ndarray or None): B arrays of labels
+            matching point_coords. 1 indicates a foreground point and 0 a
+            background point.
+          boxes (np.ndarray or None): A Bx4 array of box prompts, in XYXY
+            format.
+          mask_input (np.ndarray or None): Low resolution masks from a
+            previous iteration, in Bx1xHxW format where H=W=256.
+          multimask_output (bool): If true, the model will return three masks
+            per prompt set. See predict.
+          return_logits (bool): If true, returns un-thresholded masks logits
+            instead of a binary mask.
+          upscale (bool): If false, the full resolution masks are not built;
+            a LowResMasks holding the decoder logits is returned instead.
+
+        Returns:
+          (np.ndarray or LowResMasks): The output masks in BxCxHxW format,
+            where (H, W) is the original image size.
+          (np.ndarray): An array of shape BxC with the predicted mask quality.
+          (np.ndarray): Low resolution logits in BxCx256x256 format.
+        """
+        if features.get('features', None) is None:
+            raise RuntimeError('An image must be set with .set_image(...)'
+                               ' before mask prediction.')
+
+        original_size = features['original_size']
         coords_torch, labels_torch = None, None
         box_torch, mask_input_torch = None, None
         if point_coords is not None:
             assert (point_labels is not None
                     ), 'point_labels must be supplied if point_coords is supplied.'
-            point_coords = self.transform.apply_coords(point_coords,
-                                                       features['original_size'])
-            coords_torch = torch.as_tensor(
-                point_coords, dtype=torch.float, device=self.device)
-            labels_torch = torch.as_tensor(
-                point_labels, dtype=torch.int, device=self.device)
-            coords_torch, labels_torch = coords_torch[None, :, :], labels_torch[None, :]
-        if box is not None:
-            box = self.transform.apply_boxes(box, features['original_size'])
-            box_torch = torch.as_tensor(box, dtype=torch.float, device=self.device)
-            box_torch = box_torch[None, :]
+            assert len(point_coords) == len(point_labels), (
+                'point_coords and point_labels must hold the same number of'
+                ' prompt sets.')
+        if boxes is not None:
+            boxes = self.transform.apply_boxes(np.asarray(boxes), original_size)
+            box_torch = torch.as_tensor(boxes, dtype=torch.float, device=self.device)
         if mask_input is not None:
             mask_input_torch = torch.as_tensor(
                 mask_input, dtype=torch.float, device=self.device)
-            mask_input_torch = mask_input_torch[None, :, :, :]
-
-        masks, iou_predictions, low_res_masks = self.predict_torch(
-            features,
-            coords_torch,
-            labels_torch,
-            box_torch,
-            mask_input_torch,
-            multimask_output,
-            return_logits=return_logits,
-        )
 
-        masks_np = masks[0].detach().cpu().numpy()
-        iou_predictions_np = iou_predictions[0].detach().cpu().numpy()
-        low_res_masks_np = low_res_masks[0].detach().cpu().numpy()
+        # Padding points still attend in the decoder, so prompt sets are
+        # grouped by their number of points to match the unbatched results
+        if point_coords is None:
+            groups = [None]
+        else:
+            by_size = {}
+            for i, c in enumerate(point_coords):
+                by_size.setdefault(len(c), []).append(i)
+            groups = list(by_size.values())
+            if len(groups) == 1:
+                groups = [slice(None)]
+
+        outputs = []
+        for index in groups:
+            if index is not None:
+                ids = range(len(point_coords))[index] if isinstance(index, slice) else index
+                coords = np.stack([np.asarray(point_coords[i], dtype=np.float32).reshape(-1, 2)
+                                   for i in ids])
+                labels = np.stack([np.asarray(point_labels[i]).reshape(-1) for i in ids])
+                coords = self.transform.apply_coords(coords, original_size)
+                coords_torch = torch.as_tensor(coords, dtype=torch.float, device=self.device)
+                labels_torch = torch.as_tensor(labels, dtype=torch.int, device=self.device)
+            with torch.no_grad():
+                outputs.append(self.predict_torch(
+                    features,
+                    coords_torch,
+                    labels_torch,
+                    _take(box_torch, index),
+                    _take(mask_input_torch, index),
+                    multimask_output,
+                    return_logits=return_logits,
+                    upscale=upscale,
+                ))
+
+        if len(groups) == 1:
+            masks, iou_predictions, low_res_masks = outputs[0]
+        else:
+            order = torch.as_tensor(np.argsort(np.concatenate(groups)), device=self.device)
+            masks, iou_predictions, low_res_masks = (
+                None if parts[0] is None else torch.cat(parts)[order]
+                for parts in zip(*outputs))
+
+        iou_predictions_np = iou_predictions.detach().cpu().numpy()
+        low_res_masks_np = low_res_masks.detach().cpu().numpy()
+        if not upscale:
+            masks_np = LowResMasks(low_res_masks_np, features['input_size'],
+                                   features['original_size'],
+                                   self.model.image_encoder.img_size,
+                                   self.model.mask_threshold)
+            return masks_np, iou_predictions_np, low_res_masks_np
+        masks_np = masks.detach().cpu().numpy()
         return masks_np, iou_predictions_np, low_res_masks_np
 
     def predict_torch(
@@ -223,6 +463,7 @@ class SamPredictor:
         mask_input: Optional[Tensor] = None,
         multimask_output: bool = True,
         return_logits: bool = False,
+        upscale: bool = True,
     ) -> Tuple[Tensor, Tensor, Tensor]:
         """Predict masks for the given input prompts, using the currently set
         image. Input prompts are batched torch tensors and are expected to
@@ -249,10 +490,12 @@ class SamPredictor:
             results.
           return_logits (bool): If true, returns un-thresholded masks logits
             instead of a binary mask.
+          upscale (bool): If false, skips building the full resolution
+            masks, and None is returned in their place.
 
         Returns:
-          (Tensor): The output masks in BxCxHxW format, where C is the
-            number of masks, and (H, W) is the original image size.
+          (Tensor or None): The output masks in BxCxHxW format, where C is
+            the number of masks, and (H, W) is the original image size.
           (Tensor): An array of shape BxC containing the model's
             predictions for the quality of each mask.
           (Tensor): An array of shape BxCxHxW, where C is the number
@@ -278,12 +521,15 @@ class SamPredictor:
         # Predict masks
         low_res_masks, iou_predictions = self.model.mask_decoder(
             image_embeddings=features['features'],
-            image_pe=self.model.prompt_encoder.get_dense_pe(),
+            image_pe=self.dense_pe,
             sparse_prompt_embeddings=sparse_embeddings,
             dense_prompt_embeddings=dense_embeddings,
             multimask_output=multimask_output,
         )
 
+        if not upscale:
+            return None, iou_predictions, low_res_masks
+
         # Upscale the masks to the original image resolution
         masks = self.model.postprocess_masks(low_res_masks, features['input_size'],
                                              features['original_size'])
@@ -296,6 +542,31 @@ class SamPredictor:
     def get_image_embedding(self, image) -> Tensor:
         return self.set_image(image)
 
+    def _encode_batch(self, images):
+        # Inputs are all padded to the encoder size, so they stack as is
+        with torch.no_grad():
+            return list(self.model.image_encoder(torch.stack(images)))
+
+    def close(self):
+        """Stop the encoder batching worker."""
+        if self._encoder_batcher is not None:
+            self._encoder_batcher.close()
+            self._encoder_batcher = None
+
+    def __del__(self):
+        batcher = getattr(self, '_encoder_batcher', None)
+        if batcher is not None:
+            batcher.close()
+
+    @property
+    def dense_pe(self) -> Tensor:
+        """Positional encoding of the embedding grid, the same for every
+        image, so it is computed once."""
+        if getattr(self, '_dense_pe', None) is None:
+            with torch.no_grad():
+                self._dense_pe = self.model.prompt_encoder.get_dense_pe()
+        return self._dense_pe
+
     @property
     def device(self):
         return self.model.device
@@ -309,6 +580,14 @@ class SegmentAnything(BaseTool):
             in the ``segment_anything`` repository.
             Defaults to ``sam_vit_h_4b8939.pth``.
         device (str): The device to load the model. Defaults to 'cuda'.
+        preset (str): The mask generator settings, one of
+            ``MASK_GENERATOR_PRESETS``. Defaults to 'default'.
+        generator_config (dict, optional): Overrides of the preset settings,
+            e.g. ``points_per_batch``. Defaults to None.
+        max_batch_size (int): Maximum number of concurrent requests whose
+            images are encoded in one forward. Defaults to 1 (no batching).
+        batch_window_ms (float): How long the encoder waits for more
+            requests, in milliseconds. Defaults to 5.
         toolmeta (None | dict | ToolMeta): The additional info of the tool.
             Defaults to None.
     """
@@ -320,83 +599,166 @@ class SegmentAnything(BaseTool):
     def __init__(self,
                  sam_model: str = 'sam_vit_h_4b8939.pth',
                  device: str = 'cuda',
+                 preset: str = 'default',
+                 generator_config: Optional[dict] = None,
+                 max_batch_size: int = 1,
+                 batch_window_ms: float = 5.0,
                  toolmeta=None):
         super().__init__(toolmeta=toolmeta)
         self.sam_model = sam_model
         self.device = device
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+        self.generator_config = mask_generator_config(
+            preset, **(generator_config or {}))
+        self._mask_generators = {}
+        self._generators_lock = threading.Lock()
 
     def setup(self):
         self.sam, self.sam_predictor = load_sam_and_predictor(
-            self.sam_model, device=self.device)
+            self.sam_model, device=self.device,
+            max_batch_size=self.max_batch_size,
+            batch_window_ms=self.batch_window_ms)
+
+    def teardown(self):
+        with self._generators_lock:
+            generators, self._mask_generators = self._mask_generators, {}
+        for generator in generators.values():
+            release_object(generator)
+        release_sam_and_predictor(self.sam, self.sam_predictor)
+        self.sam, self.sam_predictor = None, None
+
+    def get_mask_generator(self, preset: Optional[str] = None, **overrides):
+        """The mask generator of a configuration, built once and shared."""
+        if preset is None:
+            config = {**self.generator_config, **overrides}
+        else:
+            config = mask_generator_config(preset, **overrides)
+        # Overrides such as point_grids are not hashable
+        key = freeze_arguments(config)
+        # Concurrent misses must take a single reference on the shared generator
+        with self._generators_lock:
+            generator = self._mask_generators.get(key)
+            if generator is None:
+                generator = load_or_build_object(build_mask_generator, self.sam, **config)
+                self._mask_generators[key] = generator
+        return generator
 
     def apply(self, image: ImageIO
-              ) -> Annotated[ImageIO, Info('The segmentation result image.')]:
+              ) -> Annotated[MaskResult, Info('The masks and the segmentation result image.')]:
         annos = self.segment_anything(image.to_array())
         full_img, _ = self.show_annos(annos)
-        return ImageIO(full_img)
+        boxes = np.array([ann['bbox'] for ann in annos], dtype=np.float32).reshape(-1, 4)
+        boxes[:, 2:] += boxes[:, :2]
+        return MaskResult(
+            [ann['segmentation'] for ann in annos],
+            boxes=boxes,
+            scores=[ann['predicted_iou'] for ann in annos],
+            image=image if full_img is None else ImageIO(full_img))
+
+    def segment_anything(self, img, preset: Optional[str] = None, **overrides):
+        """Segment everything in ``img``.
 
-    def segment_anything(self, img):
+        Args:
+            preset (str, optional): Use this preset instead of the tool's
+                settings. Defaults to None.
+            **overrides: Mask generator settings for this call.
+
+        Returns:
+            list[dict]: The mask generator annotations, with each
+            ``segmentation`` stored as an :class:`RLEMask`.
+        """
         if not self._is_setup:
             self.setup()
             self._is_setup = True
 
-        from segment_anything import SamAutomaticMaskGenerator
-
-        mask_generator = SamAutomaticMaskGenerator(self.sam)
-        annos = mask_generator.generate(img)
+        mask_generator = self.get_mask_generator(preset, **overrides)
+        with mask_generator.lock:
+            annos = mask_generator.generate(img)
+        for ann in annos:
+            ann['segmentation'] = RLEMask.from_coco(ann['segmentation'])
 
         return annos
 
     def segment_by_mask(self, mask, features):
-        random.seed(GLOBAL_SEED)
-        idxs = np.nonzero(mask)
-        num_points = min(max(1, int(len(idxs[0]) * 0.01)), 16)
-        sampled_idx = random.sample(range(0, len(idxs[0])), num_points)
-        new_mask = []
-        for i in range(len(idxs)):
-            new_mask.append(idxs[i][sampled_idx])
-        points = np.array(new_mask).reshape(2, -1).transpose(1, 0)[:, ::-1]
-        labels = np.array([1] * num_points)
-
-        res_masks, scores, _ = self.sam_predictor.predict(
+        return self.segment_by_masks([mask], features)[0]
+
+    def segment_by_masks(self, masks, features) -> np.ndarray:
+        """Refine several masks with one batched decoder pass.
+
+        Up to 16 points are sampled inside each mask and used as its
+        foreground prompt; the best scoring output is kept for each mask.
+
+        Args:
+            masks (list[np.ndarray]): Binary masks of shape (H, W).
+            features (dict): The image embedding from ``set_image``.
+
+        Returns:
+            np.ndarray: The refined masks, with shape (N, H, W).
+        """
+        point_coords: List[np.ndarray] = []
+        point_labels: List[np.ndarray] = []
+        for mask in masks:
+            # Seeded per mask, so each mask gets the points it would alone
+            random.seed(GLOBAL_SEED)
+            idxs = np.nonzero(mask)
+            num_points = min(max(1, int(len(idxs[0]) * 0.01)), 16)
+            sampled_idx = random.sample(range(0, len(idxs[0])), num_points)
+            new_mask = []
+            for i in range(len(idxs)):
+                new_mask.append(idxs[i][sampled_idx])
+            points = np.array(new_mask).reshape(2, -1).transpose(1, 0)[:, ::-1]
+            point_coords.append(points)
+            point_labels.append(np.ones(num_points, dtype=np.int64))
+
+        res_masks, scores, _ = self.sam_predictor.predict_batch(
             features=features,
-            point_coords=points,
-            point_labels=labels,
+            point_coords=point_coords,
+            point_labels=point_labels,
             multimask_output=True,
         )
-
-        return res_masks[np.argmax(scores), :, :]
+        best = np.argmax(scores, axis=1)
+        return res_masks[np.arange(len(best)), best]
 
     def get_detection_map(self, img):
         annos = self.segment_anything(img)
-        _, detection_map = self.show_anns(annos)
+        _, detection_map = self.show_annos(annos)
 
         return detection_map
 
     def show_annos(self, anns):
+        """Draw the annotations with one color per mask.
+
+        Masks are painted into a uint16 label map, largest first so that
+        smaller masks stay on top, and the colors come from a seeded palette
+        LUT in a single lookup.
+
+        Returns:
+            tuple: The colored masks as a PIL image, and the label map as a
+            uint8 HxWx3 array holding the low and high byte of each label.
+        """
         if len(anns) == 0:
-            return
+            return None, None
 
         sorted_anns = sorted(anns, key=(lambda x: x['area']), reverse=True)
-        full_img = None
-
-        # for ann in sorted_anns:
-        for i in range(len(sorted_anns)):
-            ann = anns[i]
+        first = sorted_anns[0]['segmentation']
+        h, w = first.size if isinstance(first, RLEMask) else first.shape[:2]
+        # Column-major storage, so RLE runs map to contiguous slices
+        label_map = np.zeros((w, h), dtype=np.uint16).T
+        flat_labels = label_map.T.reshape(-1)
+        for label, ann in enumerate(sorted_anns, start=1):
             m = ann['segmentation']
-            if full_img is None:
-                full_img = np.zeros((m.shape[0], m.shape[1], 3))
-                map = np.zeros((m.shape[0], m.shape[1]), dtype=np.uint16)
-            map[m != 0] = i + 1
-            color_mask = np.random.random((1, 3)).tolist()[0]
-            full_img[m != 0] = color_mask
-        full_img = full_img * 255
-
-        res = np.zeros((map.shape[0], map.shape[1], 3))
-        res[:, :, 0] = map % 256
-        res[:, :, 1] = map // 256
-        res.astype(np.float32)
-        full_img = Image.fromarray(np.uint8(full_img))
+            if isinstance(m, RLEMask):
+                flat_labels[m.foreground_indices()] = label
+            else:
+                label_map[np.asarray(m) != 0] = label
+
+        palette = label_palette(len(sorted_anns), seed=GLOBAL_SEED)
+        full_img = Image.fromarray(palette[label_map])
+
+        res = np.zeros((h, w, 3), dtype=np.uint8)
+        res[:, :, 0] = label_map & 0xff
+        res[:, :, 1] = label_map >> 8
         return full_img, res
 
 
@@ -421,6 +783,10 @@ class SegmentObject(BaseTool):
             Which can be found in the ``MMDetection`` repository.
             Defaults to ``glip_atss_swin-t_a_fpn_dyhead_pretrain_obj365``.
         device (str): The device to load the model. Defaults to 'cpu'.
+        max_batch_size (int): Maximum number of concurrent requests whose
+            images are encoded in one forward. Defaults to 1 (no batching).
+        batch_window_ms (float): How long the encoder waits for more
+            requests, in milliseconds. Defaults to 5.
         toolmeta (None | dict | ToolMeta): The additional info of the tool.
             Defaults to None.
     """
@@ -436,11 +802,15 @@ class SegmentObject(BaseTool):
             sam_model: str = 'sam_vit_h_4b8939.pth',
             grounding_model: str = ('glip_atss_swin-t_a_fpn_dyhead_pretrain_obj365'),
             device: str = 'cuda',
+            max_batch_size: int = 1,
+            batch_window_ms: float = 5.0,
             toolmeta=None):
         super().__init__(toolmeta=toolmeta)
         self.sam_model = sam_model
         self.grounding_model = grounding_model
         self.device = device
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
 
     def setup(self):
         from mmdet.apis import DetInferencer
@@ -449,29 +819,66 @@ class SegmentObject(BaseTool):
             DetInferencer, model=self.grounding_model, device=self.device)
 
         self.sam, self.sam_predictor = load_sam_and_predictor(
-            self.sam_model, device=self.device)
+            self.sam_model, device=self.device,
+            max_batch_size=self.max_batch_size,
+            batch_window_ms=self.batch_window_ms)
+
+        # The SAM encoder only needs the image, so it runs here while the
+        # grounding model looks for the boxes. The tool instance is shared
+        # by concurrent requests, so the pool has at least max_batch_size
+        # workers: their encodes reach the predictor's batcher together
+        self._encoder_pool = load_or_build_object(
+            ThreadPoolExecutor,
+            max_workers=max(self.max_batch_size, ENCODER_WORKERS),
+            thread_name_prefix='SegmentObject-encoder')
+
+    def teardown(self):
+        if release_object(self._encoder_pool) == 0:
+            self._encoder_pool.shutdown(wait=True)
+        release_object(self.grounding)
+        release_sam_and_predictor(self.sam, self.sam_predictor)
+        self.grounding, self.sam, self.sam_predictor = None, None, None
 
     def apply(
         self,
         image: ImageIO,
         text: Annotated[str, Info('The object to segment.')],
-    ) -> Annotated[ImageIO, Info('The segmentation result image.')]:
+    ) -> Annotated[MaskResult, Info('The masks and the segmentation result image.')]:
+        if not self._is_setup:
+            self.setup()
+            self._is_setup = True
 
-        results = self.grounding(
-            inputs=image.to_array()[:, :, ::-1],  # Input BGR
-            texts=text,
-            no_save_vis=True,
-            return_datasamples=True)
+        image_array = image.to_array()
+        # PyTorch releases the GIL, so grounding and encoding overlap
+        features = self._encoder_pool.submit(
+            self.sam_predictor.get_image_embedding, image)
+        try:
+            results = self.grounding(
+                inputs=image.to_bgr(),  # Input BGR
+                texts=text,
+                no_save_vis=True,
+                return_datasamples=True)
+        except BaseException:
+            features.cancel()
+            raise
         results = results['predictions'][0].pred_instances
 
         boxes_filt = results.bboxes
         pred_phrases = results.label_names
 
-        output_image = self.segment_image_with_boxes(image.to_array(), boxes_filt,
-                                                     pred_phrases)
-        return ImageIO(output_image)
-
-    def get_mask_with_boxes(self, image, boxes_filt):
+        masks = self.segment_image_with_boxes(
+            image_array, boxes_filt, pred_phrases, render=False,
+            features=features.result())
+        output_image = overlay_masks(image_array, masks, alpha=0.3, seed=GLOBAL_SEED)
+        scores = getattr(results, 'scores', None)
+        return MaskResult(
+            masks,
+            boxes=np.asarray(boxes_filt.cpu()),
+            scores=None if scores is None else np.asarray(scores.cpu()),
+            labels=pred_phrases,
+            image=ImageIO(output_image))
+
+    def get_mask_with_boxes(self, image, boxes_filt, upscale=True, features=None):
         if not self._is_setup:
             self.setup()
             self._is_setup = True
@@ -480,30 +887,56 @@ class SegmentObject(BaseTool):
         transformed_boxes = self.sam_predictor.transform.apply_boxes_torch(
             boxes_filt, image.shape[:2]).to(self.device)
 
-        features = self.sam_predictor.get_image_embedding(image)
-
-        masks, _, _ = self.sam_predictor.predict_torch(
-            features=features,
-            point_coords=None,
-            point_labels=None,
-            boxes=transformed_boxes.to(self.device),
-            multimask_output=False,
-        )
+        if features is None:
+            features = self.sam_predictor.get_image_embedding(image)
+
+        with torch.no_grad():
+            masks, _, low_res_masks = self.sam_predictor.predict_torch(
+                features=features,
+                point_coords=None,
+                point_labels=None,
+                boxes=transformed_boxes.to(self.device),
+                multimask_output=False,
+                upscale=upscale,
+            )
+        if not upscale:
+            return LowResMasks(low_res_masks, features['input_size'],
+                               features['original_size'],
+                               self.sam.image_encoder.img_size,
+                               self.sam.mask_threshold)
         return masks
 
-    def segment_image_with_boxes(self, image, boxes_filt, pred_phrases):
+    def get_rle_masks_with_boxes(self, image, boxes_filt):
+        """Segment the boxes and return one :class:`RLEMask` per box.
+
+        Masks are upscaled and encoded one at a time, so no full
+        resolution mask batch is ever held.
+        """
+        masks = self.get_mask_with_boxes(image, boxes_filt, upscale=False)
+        return [RLEMask.encode(masks.upscale((i, 0))) for i in range(len(masks))]
+
+    def segment_image_with_boxes(self, image, boxes_filt, pred_phrases, render=True,
+                                 features=None):
+        """Segment the boxes and draw the masks on the image.
+
+        Args:
+            render (bool): If false, return the masks as a
+                :class:`LowResMasks` of shape (N, H, W) instead of drawing.
+            features (dict, optional): The image embedding, when already
+                computed. Defaults to None.
+        """
         if not self._is_setup:
             self.setup()
             self._is_setup = True
 
-        masks = self.get_mask_with_boxes(image, boxes_filt)
+        # One host transfer for all masks; they stay at the decoder
+        # resolution and are upscaled box by box while blending
+        masks = self.get_mask_with_boxes(
+            image, boxes_filt, upscale=False, features=features)[:, 0]
+        if not render:
+            return masks
 
-        # draw output image
-        for mask in masks:
-            image = self.show_mask(
-                mask[0].cpu().numpy(), image, random_color=True, transparency=0.3)
-
-        return image
+        return overlay_masks(image, masks, alpha=0.3, seed=GLOBAL_SEED)
 
     def show_mask(self,
                   mask: np.ndarray,
@@ -1,6 +1,12 @@
 from .io_types import ImageIO
+from .shared_io import SharedImageIO
+from .detection import DetectionResult
+from .masks import LowResMasks, MaskResult, RLEMask
+from .results import RESULT_TYPES, ErrorResult, ImageResult, ToolResult, register_result
 
 Annotated = type
 Info = str
 
-__all__ = ['ImageIO', 'Annotated', 'Info']
\ No newline at end of file
+__all__ = ['ImageIO', 'SharedImageIO', 'DetectionResult', 'ErrorResult', 'ImageResult',
+           'LowResMasks', 'MaskResult', 'RLEMask', 'ToolResult', 'RESULT_TYPES',
+           'register_result', 'Annotated', 'Info']
\ No newline at end of file
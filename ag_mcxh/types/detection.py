@@ -0,0 +1,169 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .results import ToolResult, register_result
+
+
+@register_result('detections')
+class DetectionResult(ToolResult):
+    """Columnar detection results backed by NumPy arrays.
+
+    Boxes are converted from the model tensors in one step and kept as
+    arrays; the per-box dicts and the JSON text are only built when asked
+    for, and then cached. ``str(result)`` is the JSON text.
+
+    Args:
+        xyxy (np.ndarray): Boxes in XYXY pixel format, with shape (N, 4).
+        conf (np.ndarray): Confidence of each box, with shape (N, ).
+        cls (np.ndarray): Class index of each box, with shape (N, ).
+        names (dict | list, optional): Mapping from class index to class
+            name. Defaults to None.
+        render_fn (Callable, optional): Produces the annotated BGR image on
+            demand. Defaults to None.
+        meta (dict, optional): Additional top-level fields of the
+            serialized forms, e.g. ``image_path``. Defaults to None.
+    """
+
+    __slots__ = ('xyxy', 'conf', 'cls', 'names', 'render_fn', 'meta',
+                 '_rendered', '_dicts')
+
+    def __init__(self,
+                 xyxy: np.ndarray,
+                 conf: np.ndarray,
+                 cls: np.ndarray,
+                 names: Optional[Union[Dict[int, str], Sequence[str]]] = None,
+                 render_fn: Optional[Callable[[], np.ndarray]] = None,
+                 meta: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.cls = np.asarray(cls).reshape(-1).astype(np.int64)
+        self.names = names if names is not None else {}
+        self.render_fn = render_fn
+        self.meta = meta or {}
+        self._rendered = None
+        self._dicts = None
+
+    @classmethod
+    def empty(cls, names=None) -> 'DetectionResult':
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32),
+                   np.zeros(0, np.int64), names)
+
+    @classmethod
+    def from_yolo(cls, result, names=None) -> 'DetectionResult':
+        """Convert an ultralytics ``Results`` object.
+
+        The boxes tensor is moved to the host in a single transfer instead of
+        reading every field of every box separately. ``Results.plot`` is kept
+        for :meth:`render`.
+        """
+        if isinstance(result, DetectionResult):
+            return result
+        names = names if names is not None else getattr(result, 'names', None)
+        render_fn = getattr(result, 'plot', None)
+        boxes = getattr(result, 'boxes', None)
+        if boxes is None or len(boxes) == 0:
+            empty = cls.empty(names)
+            empty.render_fn = render_fn
+            return empty
+        data = boxes.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        data = np.asarray(data)
+        # data is (N, 6) xyxy-conf-cls, or (N, 7) with a track id before conf
+        return cls(data[:, :4], data[:, -2], data[:, -1], names, render_fn)
+
+    @classmethod
+    def concatenate(cls, results: Sequence['DetectionResult'],
+                    names=None) -> 'DetectionResult':
+        """Stack several results into one."""
+        if not results:
+            return cls.empty(names)
+        names = names if names is not None else results[0].names
+        return cls(np.concatenate([r.xyxy for r in results]),
+                   np.concatenate([r.conf for r in results]),
+                   np.concatenate([r.cls for r in results]), names)
+
+    def select(self, indices) -> 'DetectionResult':
+        """Return the boxes at ``indices`` (an index array or a mask)."""
+        return self.__class__(self.xyxy[indices], self.conf[indices],
+                              self.cls[indices], self.names, self.render_fn,
+                              self.meta)
+
+    def with_boxes(self, xyxy: np.ndarray) -> 'DetectionResult':
+        """Return the same detections with other box coordinates, e.g.
+        mapped back from a reduced decode with ``ImageIO.to_original``."""
+        return self.__class__(xyxy, self.conf, self.cls, self.names, self.render_fn,
+                              self.meta)
+
+    def with_meta(self, **meta) -> 'DetectionResult':
+        """Return the same detections with more top-level fields."""
+        result = self.__class__(self.xyxy, self.conf, self.cls, self.names,
+                                self.render_fn, {**self.meta, **meta})
+        result._rendered = self._rendered
+        result._dicts = self._dicts
+        return result
+
+    def __len__(self) -> int:
+        return len(self.conf)
+
+    def class_name(self, class_id: int) -> str:
+        try:
+            return self.names[class_id]
+        except (KeyError, IndexError, TypeError):
+            return str(class_id)
+
+    @property
+    def class_names(self) -> List[str]:
+        return [self.class_name(c) for c in self.cls.tolist()]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Return one dict per box, in the format the tools used to emit."""
+        if self._dicts is None:
+            boxes = self.xyxy.astype(np.int64).tolist()
+            self._dicts = [{
+                'class_id': class_id,
+                'class_name': self.class_name(class_id),
+                'confidence': confidence,
+                'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
+            } for class_id, confidence, (x1, y1, x2, y2) in zip(
+                self.cls.tolist(), self.conf.astype(np.float64).tolist(), boxes)]
+        return self._dicts
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'detections': self.to_dicts(), **self.meta}
+
+    def to_json(self, **extra) -> str:
+        """Serialize to JSON, with the boxes under ``detections``.
+
+        Args:
+            **extra: Additional top-level fields, e.g. ``image_path``.
+        """
+        if extra:
+            return json.dumps({**self.to_dict(), **extra})
+        return super().to_json()
+
+    def _parts(self):
+        used = np.unique(self.cls).tolist()
+        names = {str(class_id): self.class_name(class_id) for class_id in used}
+        return ({'names': names, 'meta': self.meta},
+                {'xyxy': self.xyxy, 'conf': self.conf, 'cls': self.cls.astype(np.int32)})
+
+    @classmethod
+    def _from_parts(cls, header, arrays):
+        names = {int(k): v for k, v in header['names'].items()}
+        return cls(arrays['xyxy'], arrays['conf'], arrays['cls'], names,
+                   meta=header['meta'])
+
+    def render(self) -> np.ndarray:
+        """Return the annotated BGR image, rendering it on first use."""
+        if self._rendered is None:
+            if self.render_fn is None:
+                raise RuntimeError('This detection result cannot be rendered')
+            self._rendered = self.render_fn()
+        return self._rendered
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(num_boxes={len(self)})'
@@ -1,15 +1,377 @@
+import hashlib
+import io
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple, Union
+
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
+
+COLOR_FORMATS = ('RGB', 'BGR')
+# Largest power-of-two reduction libjpeg can apply while decoding
+MAX_REDUCTION = 8
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+# Derived views (resized, letterboxed...) kept per image
+MAX_DERIVED_VIEWS = 8
+DIGEST_SIZE = 16
+
+# id(array) -> (weak reference, content key) of the arrays handed out by
+# ImageIO, so that content hashes of those arrays skip reading the pixels
+_VIEW_KEYS: Dict[int, Tuple[weakref.ref, str]] = {}
+_VIEW_KEYS_LOCK = threading.Lock()
+
 
 class ImageIO:
-    def __init__(self, image_path):
-        self.image_path = image_path
-        self._image = None
+    """An image from a file path, encoded bytes, a decoded array or a PIL image.
+
+    The source is kept without copying (bytes-like sources behind a
+    memoryview, arrays and PIL images by reference) and decoded lazily, at
+    most once. The RGB and BGR arrays are cached views of that decode,
+    shared read-only by every tool that receives this image, and so are the
+    preprocessed views built with :meth:`derived`. The source must not be
+    modified afterwards.
+
+    :attr:`digest` identifies the content, hashing the encoded bytes once
+    (no decode needed); caches of per-image results can key on it.
+
+    Args:
+        source (str | bytes | bytearray | memoryview | np.ndarray | PIL.Image.Image):
+            An image file, the encoded file content, an HWC uint8 array or a
+            PIL image.
+        image_format (str): Channel order of an array source, 'RGB' or
+            'BGR'. Defaults to 'RGB'.
+        target_size (int | tuple, optional): Size the consumers will resize
+            the image to, as a long side (e.g. 640 for YOLO, 1024 for SAM)
+            or a (width, height). Files and bytes are then decoded at the
+            largest power-of-two reduction (up to 1/8) that stays at least
+            that large: JPEGs are scaled by libjpeg while decoding (PIL
+            ``draft``), other formats are reduced right after. Use
+            :attr:`scale` or :meth:`to_original` to map coordinates on the
+            decoded image back to the full image. Decoded sources are kept
+            at their size. Defaults to None (full resolution).
+    """
+
+    def __init__(self, source, image_format: str = 'RGB',
+                 target_size: Optional[Union[int, Tuple[int, int]]] = None):
+        if image_format not in COLOR_FORMATS:
+            raise ValueError(f'image_format must be one of {COLOR_FORMATS}, got {image_format}')
+        self.image_path = None
+        self.target_size = target_size
+        self.reduction = 1
+        self._original_size = None
+        self._buffer = None
+        self._pil = None
+        self._views = {}
+        self._derived = OrderedDict()
+        self._digest = None
+        self._lock = threading.RLock()
+        if isinstance(source, ImageIO):
+            self.image_path = source.image_path
+            self._buffer = source._buffer
+            self._digest = source._digest
+            encoded = self.image_path is not None or self._buffer is not None
+            # Another target size decodes the source again
+            if target_size in (None, source.target_size) or not encoded:
+                self.target_size = source.target_size
+                self.reduction = source.reduction
+                self._original_size = source._original_size
+                self._pil = source._pil
+                self._views = dict(source._views)
+                self._derived = OrderedDict(source._derived)
+        elif isinstance(source, (str, os.PathLike)):
+            self.image_path = os.fspath(source)
+        elif isinstance(source, Image.Image):
+            self._pil = source
+        elif isinstance(source, np.ndarray):
+            if source.ndim == 2:
+                source = np.stack([source] * 3, axis=-1)
+            elif source.ndim != 3 or source.shape[2] not in (3, 4):
+                raise ValueError(f'Expected an HW, HWC or HWC4 array, got shape {source.shape}')
+            if source.shape[2] == 4:
+                source = source[..., :3]
+            self._views[image_format] = _readonly(source)
+            self._register(self._views[image_format], image_format)
+        else:
+            try:
+                self._buffer = memoryview(source)
+            except TypeError:
+                raise TypeError(f'Unsupported image source {type(source).__name__}') from None
+
+    def _open(self) -> Image.Image:
+        if self.image_path is not None:
+            with open(self.image_path, 'rb') as f:
+                image = self._decode(Image.open(f))
+        else:
+            image = self._decode(Image.open(io.BytesIO(self._buffer)))
+        # Same orientation as cv2.imread, which applies the EXIF rotation
+        return ImageOps.exif_transpose(image)
+
+    def _decode(self, image: Image.Image) -> Image.Image:
+        width, height = image.size
+        transposed = image.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS
+        self._original_size = (height, width) if transposed else (width, height)
+        reduction = 1
+        if self.target_size:
+            target = self.target_size
+            if not isinstance(target, int):
+                target = tuple(target)[::-1] if transposed else tuple(target)
+            reduction = _reduction((width, height), target)
+        if reduction > 1:
+            drafted = image.draft(None, (width // reduction, height // reduction))
+            if drafted is not None:
+                # libjpeg decoded at 1/scale, each pixel covering a scale^2 block
+                reduction = round(width / drafted[1][2])
+                image.load()
+            else:
+                image.load()
+                image = image.reduce(reduction)
+        else:
+            image.load()
+        self.reduction = reduction
+        return image
+
+    def to_pil(self) -> Image.Image:
+        """The decoded PIL image, in its file mode (e.g. RGBA for some PNGs)."""
+        if self._pil is None:
+            with self._lock:
+                if self._pil is None:
+                    if self.image_path is not None or self._buffer is not None:
+                        self._pil = self._open()
+                    else:
+                        self._pil = Image.fromarray(self.to_array('RGB'))
+        return self._pil
+
+    def to_array(self, image_format: str = 'RGB') -> np.ndarray:
+        """HWC uint8 array in ``image_format`` channel order ('RGB' or 'BGR').
+
+        The array is cached and read-only; copy it before drawing on it.
+        """
+        view = self._views.get(image_format)
+        if view is not None:
+            return view
+        if image_format not in COLOR_FORMATS:
+            raise ValueError(f'image_format must be one of {COLOR_FORMATS}, got {image_format}')
+        other = 'BGR' if image_format == 'RGB' else 'RGB'
+        if other not in self._views:
+            image = self.to_pil()
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            with self._lock:
+                if 'RGB' not in self._views:
+                    self._views['RGB'] = self._register(_readonly(np.asarray(image)), 'RGB')
+            if image_format == 'RGB':
+                return self._views['RGB']
+        with self._lock:
+            if image_format not in self._views:
+                self._views[image_format] = self._register(_readonly(
+                    np.ascontiguousarray(self._views[other][..., ::-1])), image_format)
+        return self._views[image_format]
+
+    def to_bgr(self) -> np.ndarray:
+        """Shortcut of ``to_array('BGR')``, the channel order of cv2 and YOLO."""
+        return self.to_array('BGR')
+
+    @property
+    def digest(self) -> str:
+        """blake2b hex digest of the image content, computed once.
+
+        Files and bytes are hashed as encoded, decoded sources by their
+        pixels. The decoded size (see ``target_size``) is not included; use
+        :meth:`view_key` for keys of decoded or derived pixels.
+        """
+        if self._digest is None:
+            with self._lock:
+                if self._digest is None:
+                    self._digest = self._hash()
+        return self._digest
+
+    def _hash(self) -> str:
+        h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        if self.image_path is not None:
+            with open(self.image_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+        elif self._buffer is not None:
+            h.update(self._buffer.cast('B') if self._buffer.ndim != 1 else self._buffer)
+        else:
+            image_format = next(iter(self._views), 'RGB')
+            array = np.ascontiguousarray(self.to_array(image_format))
+            h.update(f'{image_format}{array.shape}'.encode())
+            h.update(memoryview(array).cast('B'))
+        return h.hexdigest()
+
+    def view_key(self, *transform: Hashable) -> str:
+        """Content key of the decoded image after ``transform``."""
+        if self.target_size and self._original_size is None:
+            self.to_pil()
+        key = f'{self.digest}@{self.reduction}' if self.target_size else self.digest
+        if transform:
+            key += ':' + ':'.join(map(str, transform))
+        return key
+
+    def derived(self, transform: Tuple[Hashable, ...], build: Callable[[], Any]) -> Any:
+        """Return the view of this image built by ``build()``, cached by
+        ``transform``, e.g. ``('sam_resize', 1024, 'RGB')``.
+
+        The transform must name everything the result depends on. Only the
+        last :data:`MAX_DERIVED_VIEWS` views are kept; arrays are returned
+        read-only.
+        """
+        with self._lock:
+            if transform in self._derived:
+                self._derived.move_to_end(transform)
+                return self._derived[transform]
+            view = build()
+            if isinstance(view, np.ndarray):
+                view = _readonly(view)
+                _register_view(view, self.view_key(*transform))
+            self._derived[transform] = view
+            while len(self._derived) > MAX_DERIVED_VIEWS:
+                self._derived.popitem(last=False)
+            return view
+
+    def encode(self, fmt: Optional[str] = None) -> bytes:
+        """The image as an encoded file, cached.
+
+        Without ``fmt``, the source bytes of a file or bytes source are
+        returned as they are, and other images are encoded as PNG.
+        """
+        if fmt is None:
+            if self._buffer is not None:
+                source = self._buffer.obj
+                if isinstance(source, bytes) and len(source) == self._buffer.nbytes:
+                    return source
+                return self._buffer.tobytes()
+            if self.image_path is not None:
+                with open(self.image_path, 'rb') as f:
+                    return f.read()
+            fmt = 'png'
+
+        def build():
+            buffer = io.BytesIO()
+            image = self.to_pil()
+            if fmt.lower() in ('jpg', 'jpeg') and image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.save(buffer, format='JPEG' if fmt.lower() == 'jpg' else fmt.upper())
+            return buffer.getvalue()
+
+        return self.derived(('encode', fmt.lower()), build)
+
+    def _register(self, array: np.ndarray, image_format: str) -> np.ndarray:
+        # The digest of decoded sources hashes the pixels, only do it when asked
+        if self.image_path is not None or self._buffer is not None or self._digest:
+            _register_view(array, self.view_key(image_format))
+        return array
+
+    @property
+    def size(self):
+        """(width, height) of the decoded image."""
+        for view in self._views.values():
+            return view.shape[1], view.shape[0]
+        return self.to_pil().size
+
+    @property
+    def original_size(self) -> Tuple[int, int]:
+        """(width, height) of the full resolution image."""
+        if self._original_size is None and (self.image_path is not None or self._buffer is not None):
+            self.to_pil()
+        return self._original_size or self.size
+
+    @property
+    def scale(self) -> Tuple[float, float]:
+        """(x, y) factors from decoded to full resolution coordinates.
+
+        Pixel ``i`` of a reduced decode covers full resolution pixels
+        ``[i * scale, (i + 1) * scale)``, including the last, partial block.
+        """
+        if self.target_size and self._original_size is None:
+            self.to_pil()
+        return float(self.reduction), float(self.reduction)
+
+    def to_original(self, coords) -> np.ndarray:
+        """Map x, y coordinates on the decoded image to the full image.
+
+        Args:
+            coords (array-like): Interleaved x, y values in the last axis,
+                e.g. XYXY boxes of shape (N, 4) or points of shape (N, 2).
+
+        Returns:
+            np.ndarray: float32 coordinates clipped to the full image.
+        """
+        coords = np.asarray(coords, dtype=np.float32)
+        if self.scale == (1.0, 1.0):
+            return coords
+        width, height = self.original_size
+        out = coords * np.float32(self.reduction)
+        np.clip(out[..., 0::2], 0, width, out=out[..., 0::2])
+        np.clip(out[..., 1::2], 0, height, out=out[..., 1::2])
+        return out
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_derived'] = OrderedDict()
+        if self.image_path is not None or self._buffer is not None:
+            # Encoded images travel encoded and decode again on arrival
+            state['_views'] = {}
+            state['_pil'] = None
+            if self._buffer is not None:
+                state['_buffer'] = self._buffer.tobytes()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._buffer is not None:
+            self._buffer = memoryview(self._buffer)
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        if self.image_path is not None:
+            source = self.image_path
+        elif self._buffer is not None:
+            source = f'{self._buffer.nbytes} bytes'
+        else:
+            source = 'decoded'
+        return f'{type(self).__name__}({source})'
+
+
+def _reduction(size: Tuple[int, int], target: Union[int, Sequence[int]]) -> int:
+    """Largest power-of-two reduction of ``size`` still covering ``target``."""
+    width, height = size
+    if isinstance(target, int):
+        ratio = target / max(width, height)
+        target = (width * ratio, height * ratio)
+    reduction = 1
+    while (reduction < MAX_REDUCTION and width // (reduction * 2) >= target[0]
+           and height // (reduction * 2) >= target[1]):
+        reduction *= 2
+    return reduction
+
+
+def _register_view(array: np.ndarray, key: str):
+    def forget(_, array_id=id(array)):
+        with _VIEW_KEYS_LOCK:
+            entry = _VIEW_KEYS.get(array_id)
+            if entry is not None and entry[0]() is None:
+                del _VIEW_KEYS[array_id]
+
+    with _VIEW_KEYS_LOCK:
+        _VIEW_KEYS[id(array)] = (weakref.ref(array, forget), key)
+
+
+def array_key(array: np.ndarray) -> Optional[str]:
+    """Content key of an array handed out by an :class:`ImageIO`, else None."""
+    entry = _VIEW_KEYS.get(id(array))
+    if entry is not None and entry[0]() is array:
+        return entry[1]
+    return None
 
-    def to_array(self):
-        if self._image is None:
-            self._image = np.array(Image.open(self.image_path))
-        return self._image
 
-    def to_pil(self):
-        return Image.open(self.image_path)
\ No newline at end of file
+def _readonly(array: np.ndarray) -> np.ndarray:
+    if array.flags.writeable:
+        array = array.view()
+        array.flags.writeable = False
+    return array
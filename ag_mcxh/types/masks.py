@@ -0,0 +1,433 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .io_types import ImageIO
+from .results import ToolResult, _image_dict, register_result
+
+
+def _resize_matrix(in_size: int, out_size: int, rows: np.ndarray) -> np.ndarray:
+    """Rows of the bilinear resize operator from ``in_size`` to ``out_size``.
+
+    Matches ``F.interpolate(mode='bilinear', align_corners=False)`` along
+    one axis: ``resized[rows] == matrix @ signal``.
+    """
+    src = (rows + 0.5) * (in_size / out_size) - 0.5
+    src = np.maximum(src, 0)
+    i0 = np.minimum(src.astype(np.int64), in_size - 1)
+    i1 = np.minimum(i0 + 1, in_size - 1)
+    w1 = (src - i0).astype(np.float32)
+    matrix = np.zeros((len(rows), in_size), dtype=np.float32)
+    arange = np.arange(len(rows))
+    matrix[arange, i0] += 1 - w1
+    matrix[arange, i1] += w1
+    return matrix
+
+
+class LowResMasks:
+    """SAM mask logits kept at the decoder resolution, upscaled on demand.
+
+    SAM upscales its 256x256 logits to the encoder size, crops the padding
+    and resizes to the original image. Both steps are bilinear, so they are
+    folded into one small matrix per axis, and any crop of any mask is
+    computed directly from the low resolution logits without building the
+    full resolution masks.
+
+    Args:
+        logits (np.ndarray): Low resolution logits, with shape (..., h, w),
+            e.g. (B, C, 256, 256).
+        input_size (tuple): (H, W) of the image after ResizeLongestSide.
+        original_size (tuple): (H, W) of the original image.
+        image_size (int): Side of the square encoder input. Defaults to 1024.
+        mask_threshold (float): Logit threshold of the binary masks.
+            Defaults to 0.0.
+    """
+
+    def __init__(self,
+                 logits: np.ndarray,
+                 input_size: Tuple[int, int],
+                 original_size: Tuple[int, int],
+                 image_size: int = 1024,
+                 mask_threshold: float = 0.0):
+        if hasattr(logits, 'detach'):
+            logits = logits.detach().cpu().numpy()
+        self.logits = np.asarray(logits, dtype=np.float32)
+        self.input_size = tuple(int(s) for s in input_size)
+        self.original_size = tuple(int(s) for s in original_size)
+        self.image_size = image_size
+        self.mask_threshold = mask_threshold
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of the full resolution masks."""
+        return self.logits.shape[:-2] + self.original_size
+
+    @property
+    def nbytes(self) -> int:
+        return self.logits.nbytes
+
+    def __len__(self) -> int:
+        return len(self.logits)
+
+    def __getitem__(self, index) -> 'LowResMasks':
+        logits = self.logits[index]
+        if logits.ndim < 2:
+            raise IndexError('LowResMasks indices must keep the mask axes')
+        return LowResMasks(logits, self.input_size, self.original_size,
+                           self.image_size, self.mask_threshold)
+
+    def _axis_matrix(self, axis: int, start: int, stop: int) -> np.ndarray:
+        low_res = self.logits.shape[axis - 2]
+        rows = np.arange(start, stop)
+        # Original pixels -> cropped encoder input -> low resolution logits
+        to_input = _resize_matrix(self.input_size[axis], self.original_size[axis], rows)
+        to_low_res = _resize_matrix(low_res, self.image_size,
+                                    np.arange(self.input_size[axis]))
+        return to_input @ to_low_res
+
+    def upscale(self,
+                index=None,
+                crop: Optional[Sequence[int]] = None,
+                return_logits: bool = False) -> np.ndarray:
+        """Compute masks at the original resolution.
+
+        Args:
+            index (optional): Selects the masks to upscale, as in
+                ``logits[index]``. Defaults to None (all masks).
+            crop (sequence, optional): An XYXY window in original image
+                pixels; only this window is computed. Defaults to None
+                (the whole image).
+            return_logits (bool): Return logits instead of binary masks.
+                Defaults to False.
+
+        Returns:
+            np.ndarray: Masks with shape (..., crop height, crop width).
+        """
+        logits = self.logits if index is None else self.logits[index]
+        height, width = self.original_size
+        x0, y0, x1, y1 = (0, 0, width, height) if crop is None else (
+            int(c) for c in crop)
+        x0, x1 = max(0, x0), min(width, x1)
+        y0, y1 = max(0, y0), min(height, y1)
+        rows = self._axis_matrix(0, y0, max(y0, y1))
+        cols = self._axis_matrix(1, x0, max(x0, x1))
+        out = rows @ logits @ cols.T
+        if return_logits:
+            return out
+        return out > self.mask_threshold
+
+    def to_dense(self) -> np.ndarray:
+        """All masks as binary arrays at the original resolution."""
+        return self.upscale()
+
+    def boxes(self) -> np.ndarray:
+        """XYXY boxes of the masks in original pixels, shape (..., 4).
+
+        Computed on the low resolution logits and grown by one logit cell,
+        so each box contains its full resolution mask; empty masks get a
+        zero box.
+        """
+        h, w = self.input_size
+        low_h = int(np.ceil(h * self.logits.shape[-2] / self.image_size))
+        low_w = int(np.ceil(w * self.logits.shape[-1] / self.image_size))
+        binary = self.logits[..., :low_h, :low_w] > self.mask_threshold
+        scale_y = self.image_size / self.logits.shape[-2] * self.original_size[0] / h
+        scale_x = self.image_size / self.logits.shape[-1] * self.original_size[1] / w
+        rows, cols = binary.any(axis=-1), binary.any(axis=-2)
+        # Bilinear upscaling spreads a cell over its neighbours' pixels
+        y0 = np.argmax(rows, axis=-1) - 1
+        y1 = low_h - np.argmax(rows[..., ::-1], axis=-1) + 1
+        x0 = np.argmax(cols, axis=-1) - 1
+        x1 = low_w - np.argmax(cols[..., ::-1], axis=-1) + 1
+        boxes = np.stack([x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y], axis=-1)
+        boxes[..., 0::2] = np.clip(boxes[..., 0::2], 0, self.original_size[1])
+        boxes[..., 1::2] = np.clip(boxes[..., 1::2], 0, self.original_size[0])
+        boxes[~rows.any(axis=-1)] = 0
+        return boxes.astype(np.float32)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(shape={self.shape})'
+
+
+def _runs_to_string(counts: np.ndarray) -> str:
+    """COCO compressed RLE string, as ``pycocotools``' ``rleToString``."""
+    chars = []
+    counts = counts.tolist()
+    for i, x in enumerate(counts):
+        if i > 2:
+            x -= counts[i - 2]
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return ''.join(chars)
+
+
+def _string_to_runs(string: str) -> np.ndarray:
+    """Inverse of :func:`_runs_to_string`."""
+    counts = []
+    p = 0
+    while p < len(string):
+        x, k, more = 0, 0, True
+        while more:
+            c = ord(string[p]) - 48
+            x |= (c & 0x1f) << (5 * k)
+            more = c & 0x20
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return np.asarray(counts, dtype=np.int64)
+
+
+class RLEMask:
+    """Binary mask stored as COCO run-length encoding.
+
+    Runs are taken over the mask in column-major order and start with a
+    run of zeros, as in COCO. Area, box and set operations work on the
+    runs directly, without decoding the mask.
+
+    Args:
+        counts (np.ndarray): Run lengths, alternating zeros and ones.
+        size (tuple): (H, W) of the mask.
+    """
+
+    __slots__ = ('counts', 'size')
+
+    def __init__(self, counts, size: Sequence[int]):
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(-1)
+        self.size = (int(size[0]), int(size[1]))
+
+    @classmethod
+    def encode(cls, mask: np.ndarray) -> 'RLEMask':
+        """Encode one (H, W) binary mask."""
+        return cls.encode_batch(np.asarray(mask)[None])[0]
+
+    @classmethod
+    def encode_batch(cls, masks) -> List['RLEMask']:
+        """Encode (N, H, W) binary masks, all in one vectorized pass."""
+        if hasattr(masks, 'detach'):
+            masks = masks.detach().cpu().numpy()
+        masks = np.asarray(masks).astype(bool, copy=False)
+        n, h, w = masks.shape
+        if n == 0:
+            return []
+        # Column-major pixel order, flanked by zeros on both sides
+        flat = np.zeros((n, h * w + 2), dtype=bool)
+        flat[:, 1:-1] = masks.transpose(0, 2, 1).reshape(n, -1)
+        rows, change = np.nonzero(flat[:, 1:] != flat[:, :-1])
+        splits = np.searchsorted(rows, np.arange(1, n))
+        results = []
+        for positions in np.split(change, splits):
+            # Toggle positions always come in pairs, starting with a 1 run
+            bounds = np.concatenate([[0], positions, [h * w]])
+            counts = np.diff(bounds)
+            if len(positions) and positions[-1] == h * w:
+                counts = counts[:-1]
+            results.append(cls(counts, (h, w)))
+        return results
+
+    @classmethod
+    def from_coco(cls, rle: Dict[str, Any]) -> 'RLEMask':
+        """Build from a COCO RLE dict, compressed or not."""
+        counts = rle['counts']
+        if isinstance(counts, bytes):
+            counts = counts.decode('ascii')
+        if isinstance(counts, str):
+            counts = _string_to_runs(counts)
+        return cls(counts, rle['size'])
+
+    def to_coco(self, compressed: bool = True) -> Dict[str, Any]:
+        """COCO RLE dict, with string counts if ``compressed``."""
+        counts = _runs_to_string(self.counts) if compressed else self.counts.tolist()
+        return {'size': list(self.size), 'counts': counts}
+
+    def decode(self) -> np.ndarray:
+        """The mask as a (H, W) bool array."""
+        h, w = self.size
+        values = np.zeros(len(self.counts), dtype=bool)
+        values[1::2] = True
+        flat = np.repeat(values, self.counts)
+        if len(flat) < h * w:
+            flat = np.concatenate([flat, np.zeros(h * w - len(flat), dtype=bool)])
+        return flat.reshape(w, h).T
+
+    def foreground_indices(self) -> np.ndarray:
+        """Column-major flat indices of the foreground pixels."""
+        starts = (np.cumsum(self.counts) - self.counts)[1::2]
+        lengths = self.counts[1::2]
+        offsets = starts - np.cumsum(lengths) + lengths
+        return np.repeat(offsets, lengths) + np.arange(lengths.sum())
+
+    @property
+    def area(self) -> int:
+        return int(self.counts[1::2].sum())
+
+    @property
+    def bbox(self) -> List[int]:
+        """COCO XYWH box of the foreground, zeros for an empty mask."""
+        h = self.size[0]
+        ends = np.cumsum(self.counts)
+        starts = ends - self.counts
+        starts, ends = starts[1::2], ends[1::2]
+        keep = ends > starts
+        starts, ends = starts[keep], ends[keep] - 1
+        if len(starts) == 0:
+            return [0, 0, 0, 0]
+        x0, x1 = starts // h, ends // h
+        y0, y1 = starts % h, ends % h
+        # A run spanning several columns covers the full column height
+        spans = x0 != x1
+        y0 = np.where(spans, 0, y0)
+        y1 = np.where(spans, h - 1, y1)
+        xmin, ymin = int(x0.min()), int(y0.min())
+        return [xmin, ymin, int(x1.max()) - xmin + 1, int(y1.max()) - ymin + 1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes
+
+    def _boundaries(self) -> np.ndarray:
+        return np.cumsum(self.counts)
+
+    def _merge(self, other: 'RLEMask', op) -> 'RLEMask':
+        if self.size != other.size:
+            raise ValueError(f'Mask sizes differ: {self.size} and {other.size}')
+        total = self.size[0] * self.size[1]
+        a, b = self._boundaries(), other._boundaries()
+        points = np.unique(np.concatenate([[0], a, b]))
+        points = points[points < total]
+        # A pixel is foreground when an odd number of toggles precede it
+        inside_a = np.searchsorted(a, points, side='right') % 2 == 1
+        inside_b = np.searchsorted(b, points, side='right') % 2 == 1
+        values = op(inside_a, inside_b)
+        keep = np.concatenate([[True], values[1:] != values[:-1]])
+        starts, values = points[keep], values[keep]
+        counts = np.diff(np.concatenate([starts, [total]]))
+        if values[0]:
+            counts = np.concatenate([[0], counts])
+        return RLEMask(counts, self.size)
+
+    def union(self, other: 'RLEMask') -> 'RLEMask':
+        return self._merge(other, np.logical_or)
+
+    def intersection(self, other: 'RLEMask') -> 'RLEMask':
+        return self._merge(other, np.logical_and)
+
+    __or__ = union
+    __and__ = intersection
+
+    def iou(self, other: 'RLEMask') -> float:
+        union = self.union(other).area
+        return self.intersection(other).area / union if union else 0.0
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, RLEMask) and self.size == other.size and \
+            np.array_equal(self.counts, other.counts)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(size={self.size}, area={self.area})'
+
+
+@register_result('masks')
+class MaskResult(ToolResult):
+    """Segmentation masks with their boxes, scores and labels.
+
+    Fields are read directly; the masks are only upscaled and run-length
+    encoded when a serialized form is asked for. In JSON, each mask is a
+    COCO compressed RLE and the visualization a PNG data URL.
+
+    Args:
+        masks (list[RLEMask] | LowResMasks): The masks.
+        boxes (np.ndarray, optional): XYXY boxes with shape (N, 4).
+            Defaults to the boxes of the masks.
+        scores (np.ndarray, optional): Score of each mask, shape (N, ).
+        labels (list[str], optional): Label of each mask.
+        image (ImageIO, optional): The masks drawn on the image.
+        meta (dict, optional): Additional top-level fields of the
+            serialized forms.
+    """
+
+    __slots__ = ('masks', 'boxes', 'scores', 'labels', 'image', 'meta', '_rle')
+
+    def __init__(self,
+                 masks: Union[List[RLEMask], LowResMasks],
+                 boxes: Optional[np.ndarray] = None,
+                 scores: Optional[np.ndarray] = None,
+                 labels: Optional[Sequence[str]] = None,
+                 image: Optional[ImageIO] = None,
+                 meta: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.masks = masks
+        self._rle = list(masks) if not isinstance(masks, LowResMasks) else None
+        if boxes is None:
+            boxes = masks.boxes() if isinstance(masks, LowResMasks) else \
+                [[x, y, x + w, y + h] for x, y, w, h in (m.bbox for m in self._rle)]
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = None if scores is None else np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.labels = None if labels is None else [str(label) for label in labels]
+        self.image = image
+        self.meta = meta or {}
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    @property
+    def rle_masks(self) -> List[RLEMask]:
+        """The masks as RLE, encoding low resolution masks one at a time."""
+        if self._rle is None:
+            self._rle = [RLEMask.encode(self.masks.upscale(i)) for i in range(len(self.masks))]
+        return self._rle
+
+    def to_dict(self) -> Dict[str, Any]:
+        masks = []
+        for i, (rle, box) in enumerate(zip(self.rle_masks, self.boxes.astype(np.int64).tolist())):
+            mask = {
+                'bbox': dict(zip(('x1', 'y1', 'x2', 'y2'), box)),
+                'area': rle.area,
+                'segmentation': rle.to_coco(),
+            }
+            if self.labels is not None:
+                mask['label'] = self.labels[i]
+            if self.scores is not None:
+                mask['score'] = float(self.scores[i])
+            masks.append(mask)
+        result = {'masks': masks}
+        if self.image is not None:
+            result['image'] = _image_dict(self.image)
+        return {**result, **self.meta}
+
+    def _parts(self):
+        rle = self.rle_masks
+        arrays = {
+            'boxes': self.boxes,
+            'counts': np.concatenate([m.counts for m in rle]).astype(np.uint32)
+                      if rle else np.zeros(0, np.uint32),
+            'lengths': np.array([len(m.counts) for m in rle], dtype=np.int32),
+        }
+        if self.scores is not None:
+            arrays['scores'] = self.scores
+        if self.image is not None:
+            arrays['png'] = np.frombuffer(self.image.encode('png'), dtype=np.uint8)
+        header = {'sizes': [list(m.size) for m in rle], 'labels': self.labels,
+                  'meta': self.meta}
+        return header, arrays
+
+    @classmethod
+    def _from_parts(cls, header, arrays):
+        runs = np.split(arrays['counts'], np.cumsum(arrays['lengths'])[:-1]) \
+            if len(arrays['lengths']) else []
+        masks = [RLEMask(counts, size) for counts, size in zip(runs, header['sizes'])]
+        image = ImageIO(arrays['png'].data) if 'png' in arrays else None
+        return cls(masks, arrays['boxes'], arrays.get('scores'), header['labels'],
+                   image, header['meta'])
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(num_masks={len(self)})'
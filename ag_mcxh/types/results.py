@@ -0,0 +1,208 @@
+import base64
+import json
+import struct
+from typing import Any, Dict, Optional, Tuple, Type
+
+import numpy as np
+
+from .io_types import ImageIO
+
+# Compact binary layout: magic, header length, JSON header, then the
+# arrays named in the header, each aligned to 8 bytes
+_MAGIC = b'AGR1'
+_PREFIX = struct.Struct('<4sI')
+_ALIGN = 8
+
+RESULT_TYPES: Dict[str, Type['ToolResult']] = {}
+
+
+def register_result(name: str):
+    """Register a result class under ``name`` for :meth:`ToolResult.from_bytes`."""
+    def decorator(cls):
+        cls.result_type = name
+        RESULT_TYPES[name] = cls
+        return cls
+    return decorator
+
+
+def _padding(offset: int) -> int:
+    return -offset % _ALIGN
+
+
+class ToolResult:
+    """Base class of the typed tool results.
+
+    Results keep their fields as NumPy arrays that callers read directly.
+    The JSON, MessagePack and binary forms are only built when asked for,
+    once, and ``str(result)`` is the JSON form, as tools used to return.
+
+    Subclasses implement :meth:`to_dict`, and :meth:`_parts` /
+    :meth:`_from_parts` for the binary form.
+    """
+
+    __slots__ = ('_json', '_msgpack', '_binary')
+
+    result_type: str = ''
+
+    def __init__(self):
+        self._json = None
+        self._msgpack = None
+        self._binary = None
+
+    def _invalidate(self):
+        self._json = self._msgpack = self._binary = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain Python fields, as serialized to JSON and MessagePack."""
+        raise NotImplementedError
+
+    def _parts(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """JSON header fields and arrays of the binary form."""
+        raise NotImplementedError
+
+    @classmethod
+    def _from_parts(cls, header: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'ToolResult':
+        raise NotImplementedError
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.to_dict())
+        return self._json
+
+    def to_msgpack(self) -> bytes:
+        if self._msgpack is None:
+            try:
+                import msgpack
+            except ImportError:
+                raise ImportError('Please install msgpack: pip install msgpack')
+            self._msgpack = msgpack.packb(self.to_dict(), use_bin_type=True)
+        return self._msgpack
+
+    def to_bytes(self) -> bytes:
+        """Compact binary form: a small JSON header and the raw arrays."""
+        if self._binary is None:
+            header, arrays = self._parts()
+            specs = []
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                arrays[name] = array
+                specs.append([name, array.dtype.str, list(array.shape)])
+            header = json.dumps({'type': self.result_type, 'arrays': specs,
+                                 **header}).encode()
+            chunks = [_PREFIX.pack(_MAGIC, len(header)), header]
+            offset = _PREFIX.size + len(header)
+            for array in arrays.values():
+                chunks.append(b'\0' * _padding(offset))
+                offset += _padding(offset)
+                chunks.append(array.tobytes())
+                offset += array.nbytes
+            self._binary = b''.join(chunks)
+        return self._binary
+
+    @staticmethod
+    def from_bytes(data) -> 'ToolResult':
+        """Rebuild a result from :meth:`to_bytes`; arrays view ``data``."""
+        data = memoryview(data).cast('B')
+        magic, length = _PREFIX.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError('Not a serialized tool result')
+        offset = _PREFIX.size
+        header = json.loads(bytes(data[offset:offset + length]))
+        offset += length
+        arrays = {}
+        for name, dtype, shape in header.pop('arrays'):
+            offset += _padding(offset)
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape, dtype=np.int64))
+            arrays[name] = np.frombuffer(data, dtype, count, offset).reshape(shape)
+            offset += count * dtype.itemsize
+        result_type = header.pop('type')
+        if result_type not in RESULT_TYPES:
+            raise ValueError(f'Unknown result type {result_type}')
+        return RESULT_TYPES[result_type]._from_parts(header, arrays)
+
+    def __str__(self) -> str:
+        return self.to_json()
+
+
+def _image_dict(image: ImageIO, fmt: str = 'png') -> Dict[str, Any]:
+    """Size and data URL of ``image`` encoded as ``fmt``."""
+    width, height = image.size
+    data = base64.b64encode(image.encode(fmt)).decode('ascii')
+    mime = 'jpeg' if fmt.lower() in ('jpg', 'jpeg') else fmt.lower()
+    return {'width': width, 'height': height,
+            'data': f'data:image/{mime};base64,{data}'}
+
+
+@register_result('image')
+class ImageResult(ToolResult):
+    """An image made by a tool, e.g. a visualization.
+
+    The image is only encoded when serialized: as a data URL in JSON and
+    MessagePack, as the encoded file in the binary form.
+
+    Args:
+        image (ImageIO): The image, or anything :class:`ImageIO` accepts.
+        fmt (str): Encoding of the serialized forms. Defaults to 'png'.
+        meta (dict, optional): Additional top-level fields of the
+            serialized forms.
+    """
+
+    __slots__ = ('image', 'fmt', 'meta')
+
+    def __init__(self, image, fmt: str = 'png', meta: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.image = image if isinstance(image, ImageIO) else ImageIO(image)
+        self.fmt = fmt
+        self.meta = meta or {}
+
+    def to_array(self, image_format: str = 'RGB') -> np.ndarray:
+        return self.image.to_array(image_format)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'image': _image_dict(self.image, self.fmt), **self.meta}
+
+    def _parts(self):
+        data = np.frombuffer(self.image.encode(self.fmt), dtype=np.uint8)
+        return {'fmt': self.fmt, 'meta': self.meta}, {'data': data}
+
+    @classmethod
+    def _from_parts(cls, header, arrays):
+        return cls(ImageIO(arrays['data'].data), header['fmt'], header['meta'])
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(size={self.image.size})'
+
+
+@register_result('error')
+class ErrorResult(ToolResult):
+    """A failed tool call, for callers that report errors as results.
+
+    Args:
+        message (str): The error message.
+        error_type (str): Name of the exception class. Defaults to 'Exception'.
+    """
+
+    __slots__ = ('message', 'error_type')
+
+    def __init__(self, message: str, error_type: str = 'Exception'):
+        super().__init__()
+        self.message = message
+        self.error_type = error_type
+
+    @classmethod
+    def from_exception(cls, error: BaseException) -> 'ErrorResult':
+        return cls(str(error), type(error).__name__)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'error': self.message, 'error_type': self.error_type}
+
+    def _parts(self):
+        return self.to_dict(), {}
+
+    @classmethod
+    def _from_parts(cls, header, arrays):
+        return cls(header['error'], header['error_type'])
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.error_type}: {self.message})'
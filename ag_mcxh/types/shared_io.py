@@ -0,0 +1,448 @@
+import atexit
+import mmap
+import os
+import struct
+import threading
+import weakref
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .io_types import ImageIO
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Segment layout: magic, generation, number of images mapping the segment
+# in every process, then the pixels
+_MAGIC = b'AGIM'
+_HEADER = struct.Struct('<4s4xQq')
+_HEADER_SIZE = 64
+_MIN_SEGMENT = 64 << 10
+
+
+def _size_class(nbytes: int) -> int:
+    """Round a segment size up to one of 4 classes per power of two."""
+    if nbytes <= _MIN_SEGMENT:
+        return _MIN_SEGMENT
+    step = 1 << max((nbytes - 1).bit_length() - 3, 0)
+    return (nbytes + step - 1) // step * step
+
+
+def _read_header(segment: SharedMemory) -> Tuple[int, int]:
+    magic, generation, attachments = _HEADER.unpack_from(segment.buf, 0)
+    if magic != _MAGIC:
+        raise ValueError(f'Shared memory segment {segment.name} does not hold an image')
+    return generation, attachments
+
+
+def _read_generation(segment: SharedMemory) -> int:
+    return _read_header(segment)[0]
+
+
+def _write_header(segment: SharedMemory, generation: int, attachments: int):
+    _HEADER.pack_into(segment.buf, 0, _MAGIC, generation, attachments)
+
+
+_HEADER_LOCK = threading.Lock()
+
+
+@contextmanager
+def _locked_header(segment: SharedMemory):
+    """Serialize header updates between the threads and the processes
+    mapping ``segment``. Without ``fcntl`` only threads are serialized."""
+    fd = getattr(segment, '_fd', -1)
+    with _HEADER_LOCK:
+        if fcntl is not None and fd >= 0:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None and fd >= 0:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _close_segment(segment: SharedMemory) -> bool:
+    try:
+        segment.close()
+        return True
+    except BufferError:
+        # Arrays over the segment are still alive
+        return False
+
+
+class SharedMemoryPool:
+    """Allocator of shared memory segments, reused between images.
+
+    Released segments go back to a free list by size class instead of
+    being unlinked, so steady traffic of similar frames creates no new
+    segment. Each release bumps the generation in the segment header, which
+    lets stale handles fail on attach instead of reading another image.
+    Segments that other processes still map (counted in the header) are
+    only reused once they have all detached.
+
+    Args:
+        max_free_bytes (int): Total size of the idle segments kept for
+            reuse; segments released beyond it are unlinked.
+            Defaults to 256 MiB.
+    """
+
+    def __init__(self, max_free_bytes: int = 256 << 20):
+        self.max_free_bytes = max_free_bytes
+        self._free: Dict[int, List[SharedMemory]] = {}
+        self._pending: List[SharedMemory] = []
+        self._segments: Dict[str, Tuple[SharedMemory, int]] = {}
+        self._free_bytes = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, nbytes: int) -> SharedMemory:
+        """Return a segment of at least ``nbytes``, reused when possible."""
+        size = _size_class(nbytes + _HEADER_SIZE)
+        with self._lock:
+            dropped = self._reclaim()
+            free = self._free.get(size)
+            if free:
+                self._free_bytes -= size
+                self.reused += 1
+                segment = free.pop()
+            else:
+                segment = None
+        self._unlink(dropped)
+        if segment is not None:
+            return segment
+        segment = SharedMemory(create=True, size=size)
+        _write_header(segment, 0, 0)
+        with self._lock:
+            self._segments[segment.name] = (segment, size)
+            self.created += 1
+        return segment
+
+    def release(self, segment: SharedMemory):
+        """Give a segment back; handles to its current content turn stale.
+
+        Only call it once no array over the current content is alive:
+        :class:`SharedImageIO` does it when the last of its arrays is
+        collected.
+        """
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            if segment.name not in self._segments:
+                # Already unlinked by close()
+                return
+            with _locked_header(segment):
+                generation, attachments = _read_header(segment)
+                _write_header(segment, generation + 1, attachments)
+            if attachments > 0:
+                # Reused by acquire() once the other processes detached
+                self._pending.append(segment)
+                return
+            dropped = self._recycle(segment)
+        self._unlink(dropped)
+
+    def _recycle(self, segment: SharedMemory) -> List[SharedMemory]:
+        # Requires self._lock; returns the segments to unlink
+        size = self._segments[segment.name][1]
+        if self._free_bytes + size <= self.max_free_bytes:
+            self._free.setdefault(size, []).append(segment)
+            self._free_bytes += size
+            return []
+        del self._segments[segment.name]
+        return [segment]
+
+    def _reclaim(self) -> List[SharedMemory]:
+        # Requires self._lock; recycles the pending segments no longer mapped
+        dropped = []
+        for segment in list(self._pending):
+            with _locked_header(segment):
+                _, attachments = _read_header(segment)
+            if attachments <= 0:
+                self._pending.remove(segment)
+                dropped.extend(self._recycle(segment))
+        return dropped
+
+    @staticmethod
+    def _unlink(segments: List[SharedMemory]):
+        for segment in segments:
+            segment.unlink()
+            _close_segment(segment)
+
+    def get(self, name: str) -> Optional[SharedMemory]:
+        """The segment ``name`` if this pool created it."""
+        entry = self._segments.get(name)
+        return entry[0] if entry is not None else None
+
+    def close(self):
+        """Unlink every segment of the pool, in use or not."""
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            segments = [segment for segment, _ in self._segments.values()]
+            self._segments.clear()
+            self._free.clear()
+            self._pending.clear()
+            self._free_bytes = 0
+        for segment in segments:
+            segment.unlink()
+            _close_segment(segment)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'segments': len(self._segments),
+                'free_segments': sum(len(v) for v in self._free.values()),
+                'free_bytes': self._free_bytes,
+                'pending_segments': len(self._pending),
+                'max_free_bytes': self.max_free_bytes,
+                'created': self.created,
+                'reused': self.reused,
+            }
+
+
+_SHARED_MEMORY_POOL = SharedMemoryPool()
+atexit.register(_SHARED_MEMORY_POOL.close)
+
+
+def get_shared_memory_pool() -> SharedMemoryPool:
+    """Return the process-wide shared memory pool."""
+    return _SHARED_MEMORY_POOL
+
+
+# Segments attached by this process: name -> [segment, number of images]
+_ATTACHED: Dict[str, list] = {}
+# Detached mappings that arrays still used when detaching, closed later
+_UNCLOSED: List[SharedMemory] = []
+_ATTACHED_LOCK = threading.Lock()
+
+
+def _close_unclosed():
+    # Requires _ATTACHED_LOCK
+    _UNCLOSED[:] = [segment for segment in _UNCLOSED if not _close_segment(segment)]
+
+
+def _attach_segment(name: str) -> SharedMemory:
+    with _ATTACHED_LOCK:
+        _close_unclosed()
+        entry = _ATTACHED.get(name)
+        if entry is None:
+            segment = _SHARED_MEMORY_POOL.get(name)
+            if segment is None:
+                segment = _open_segment(name)
+            entry = _ATTACHED[name] = [segment, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def _detach_segment(name: str):
+    with _ATTACHED_LOCK:
+        entry = _ATTACHED.get(name)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _ATTACHED[name]
+        if _SHARED_MEMORY_POOL.get(name) is not entry[0]:
+            # Called while the last array over the mapping is being collected
+            _UNCLOSED.append(entry[0])
+        _close_unclosed()
+
+
+def _unmap(segment: SharedMemory, pid: int):
+    """Finalizer of an attached image: uncount it in the segment header."""
+    if os.getpid() != pid:
+        return
+    with _locked_header(segment):
+        generation, attachments = _read_header(segment)
+        _write_header(segment, generation, attachments - 1)
+    _detach_segment(segment.name)
+
+
+class _AttachedSegment:
+    """Mapping of an existing POSIX segment that, unlike ``SharedMemory``
+    before Python 3.13, is not registered with the resource tracker: the
+    tracker (often shared with the owner) would otherwise unlink the segment
+    or forget the owner's registration when this process detaches."""
+
+    def __init__(self, name: str):
+        import _posixshmem
+
+        fd = _posixshmem.shm_open('/' + name, os.O_RDWR, mode=0o600)
+        try:
+            self._mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+        except BaseException:
+            os.close(fd)
+            raise
+        # Kept open to lock the header
+        self._fd = fd
+        self.name = name
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        # Raises BufferError while arrays over the mapping are alive
+        self.buf.release()
+        self._mmap.close()
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _open_segment(name: str):
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        if os.name != 'posix':
+            return SharedMemory(name=name)
+        return _AttachedSegment(name)
+
+
+class SharedImageHandle(NamedTuple):
+    """What a process needs to attach to a shared image."""
+    name: str
+    generation: int
+    shape: Tuple[int, ...]
+    image_format: str
+    dtype: str = '|u1'
+    digest: Optional[str] = None
+    reduction: int = 1
+    original_size: Optional[Tuple[int, int]] = None
+
+
+class SharedImageIO(ImageIO):
+    """An ImageIO whose decoded pixels live in shared memory.
+
+    The image is decoded once into a segment of the
+    :class:`SharedMemoryPool`; pickling it (e.g. as an argument of a
+    process pool task) only sends its :class:`SharedImageHandle`, and the
+    receiving process maps the same pixels without copying them.
+
+    The creating process owns the segment. Once every reference taken with
+    :meth:`retain` (the first one is taken on creation) has been released,
+    or the image is collected, it goes back to the pool as soon as no array
+    returned by :meth:`to_array` is alive and no other process maps it
+    anymore, so arrays kept by callers never change under them. Attaching
+    after the owner released the image raises instead of reading a
+    recycled segment. Attached images are counted in the segment header
+    until they are released (or collected) and their arrays are gone.
+
+    Args:
+        source: Anything :class:`ImageIO` accepts, including an ImageIO.
+        image_format (str): Channel order stored in shared memory, 'RGB' or
+            'BGR'. Defaults to 'RGB'.
+        pool (SharedMemoryPool, optional): Defaults to the process-wide pool.
+    """
+
+    def __init__(self, source, image_format: str = 'RGB',
+                 pool: Optional[SharedMemoryPool] = None):
+        image = source if isinstance(source, ImageIO) else ImageIO(source, image_format)
+        pixels = image.to_array(image_format)
+        pool = pool or get_shared_memory_pool()
+        segment = pool.acquire(pixels.nbytes)
+        view = np.ndarray(pixels.shape, pixels.dtype, buffer=segment.buf, offset=_HEADER_SIZE)
+        view[...] = pixels
+        # Every array over the segment keeps ``view`` alive: recycle it after them
+        self._finalizer = weakref.finalize(view, pool.release, segment)
+        encoded = image.image_path is not None or image._buffer is not None
+        self._init_shared(view, SharedImageHandle(
+            name=segment.name,
+            generation=_read_generation(segment),
+            shape=tuple(pixels.shape),
+            image_format=image_format,
+            dtype=pixels.dtype.str,
+            digest=image.digest if encoded else image._digest,
+            reduction=image.reduction,
+            original_size=image.original_size))
+        self.target_size = image.target_size
+        self._segment = segment
+        self._pool = pool
+        self._refs = 1
+
+    def _init_shared(self, view: np.ndarray, handle: SharedImageHandle):
+        ImageIO.__init__(self, view, handle.image_format)
+        self.handle = handle
+        self.reduction = handle.reduction
+        self._original_size = handle.original_size
+        self._digest = handle.digest
+        if handle.digest:
+            self._register(self._views[handle.image_format], handle.image_format)
+
+    @classmethod
+    def attach(cls, handle: SharedImageHandle) -> 'SharedImageIO':
+        """Map a shared image by its handle, in any process."""
+        segment = _attach_segment(handle.name)
+        try:
+            view = np.ndarray(handle.shape, np.dtype(handle.dtype), buffer=segment.buf,
+                              offset=_HEADER_SIZE)
+            with _locked_header(segment):
+                generation, attachments = _read_header(segment)
+                if generation != handle.generation:
+                    raise RuntimeError(f'Shared image {handle.name} was released by its owner')
+                _write_header(segment, generation, attachments + 1)
+        except BaseException:
+            view = None
+            _detach_segment(handle.name)
+            raise
+        image = cls.__new__(cls)
+        image._finalizer = weakref.finalize(view, _unmap, segment, os.getpid())
+        image._init_shared(view, handle)
+        image.target_size = None
+        image._segment = segment
+        image._pool = None
+        image._refs = 1
+        return image
+
+    def __reduce__(self):
+        return SharedImageIO.attach, (self.handle,)
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory segment."""
+        return self.handle.name
+
+    def retain(self) -> 'SharedImageIO':
+        """Take one more reference on the segment."""
+        with self._lock:
+            if self._refs <= 0:
+                raise RuntimeError(f'Shared image {self.handle.name} is already released')
+            self._refs += 1
+        return self
+
+    def release(self):
+        """Drop a reference; after the last one the segment (or mapping) is
+        freed as soon as the arrays returned by :meth:`to_array` are gone."""
+        with self._lock:
+            if self._refs <= 0:
+                return
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            # Drop our own views over the segment; the finalizer frees it
+            # once the arrays handed out are collected as well
+            self._views.clear()
+            self._derived.clear()
+            self._pil = None
+            self._segment = None
+
+    def to_array(self, image_format: str = 'RGB') -> np.ndarray:
+        segment = self._segment
+        if segment is None:
+            raise RuntimeError(f'Shared image {self.handle.name} is released')
+        if _read_generation(segment) != self.handle.generation:
+            raise RuntimeError(f'Shared image {self.handle.name} was released by its owner')
+        return super().to_array(image_format)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.handle.name}, {self.handle.shape})'
@@ -1,3 +1,6 @@
+import inspect
+import threading
+
 def is_package_available(package_name):
     """Check if a package is available for import."""
     try:
@@ -6,10 +9,114 @@ def is_package_available(package_name):
     except ImportError:
         return False
 
+def freeze_arguments(value):
+    """Convert arguments into a hashable, order-independent cache key."""
+    if isinstance(value, dict):
+        return tuple(sorted(((k, freeze_arguments(v)) for k, v in value.items()),
+                            key=lambda item: repr(item[0])))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_arguments(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze_arguments(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        # Unhashable objects (e.g. arrays) are keyed by identity
+        return ('__id__', id(value))
+
+# Process-wide cache of heavy objects (models, predictors, inferencers),
+# mapping (constructor, arguments) to [object, refcount].
+_OBJECT_CACHE = {}
+_OBJECT_KEYS = {}
+_OBJECT_BUILD_LOCKS = {}
+_OBJECT_CACHE_LOCK = threading.RLock()
+
+def _object_key(constructor, args, kwargs):
+    """Build the cache key of ``constructor(*args, **kwargs)``.
+
+    Arguments are bound to the constructor signature with defaults applied,
+    so positional and keyword spellings of the same call share one entry.
+    """
+    try:
+        bound = inspect.signature(constructor).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+    except (TypeError, ValueError):
+        arguments = {'args': args, 'kwargs': kwargs}
+    return constructor, freeze_arguments(arguments)
+
 def load_or_build_object(constructor, *args, **kwargs):
-    """Load or build an object using the given constructor and arguments."""
-    # 这是一个简化的实现
-    return constructor(*args, **kwargs)
+    """Load or build an object using the given constructor and arguments.
+
+    Objects are shared process-wide: every caller asking for the same
+    constructor and arguments gets the same instance, and each call takes a
+    reference on it. Call :func:`release_object` when done so the object can
+    be dropped once nobody uses it, or :func:`evict_object` to drop it
+    explicitly.
+    """
+    key = _object_key(constructor, args, kwargs)
+    with _OBJECT_CACHE_LOCK:
+        entry = _OBJECT_CACHE.get(key)
+        if entry is not None:
+            entry[1] += 1
+            return entry[0]
+        build_lock = _OBJECT_BUILD_LOCKS.setdefault(key, threading.Lock())
+
+    with build_lock:
+        with _OBJECT_CACHE_LOCK:
+            entry = _OBJECT_CACHE.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+
+        obj = constructor(*args, **kwargs)
+
+        with _OBJECT_CACHE_LOCK:
+            _OBJECT_CACHE[key] = [obj, 1]
+            _OBJECT_KEYS[id(obj)] = key
+            _OBJECT_BUILD_LOCKS.pop(key, None)
+    return obj
+
+def release_object(obj):
+    """Drop a reference taken by :func:`load_or_build_object`.
+
+    The object leaves the cache when its last reference is released.
+    Returns the number of remaining references.
+    """
+    with _OBJECT_CACHE_LOCK:
+        key = _OBJECT_KEYS.get(id(obj))
+        entry = _OBJECT_CACHE.get(key)
+        if entry is None or entry[0] is not obj:
+            return 0
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _OBJECT_CACHE[key]
+            del _OBJECT_KEYS[id(obj)]
+            return 0
+        return entry[1]
+
+def evict_object(obj):
+    """Remove an object from the cache regardless of its references."""
+    with _OBJECT_CACHE_LOCK:
+        key = _OBJECT_KEYS.pop(id(obj), None)
+        entry = _OBJECT_CACHE.get(key)
+        if entry is None or entry[0] is not obj:
+            return False
+        del _OBJECT_CACHE[key]
+        return True
+
+def clear_object_cache():
+    """Remove every cached object."""
+    with _OBJECT_CACHE_LOCK:
+        _OBJECT_CACHE.clear()
+        _OBJECT_KEYS.clear()
+
+def object_cache_info():
+    """Return ``(constructor name, refcount)`` for every cached object."""
+    with _OBJECT_CACHE_LOCK:
+        return [(getattr(key[0], '__qualname__', repr(key[0])), entry[1])
+                for key, entry in _OBJECT_CACHE.items()]
 
 def require(*args, **kwargs):
     """Decorator to mark tool requirements."""
@@ -23,4 +130,4 @@ def download_checkpoint(url):
 
 def download_url_to_file(url, file_path):
     """Download url to file."""
-    pass
\ No newline at end of file
+    pass
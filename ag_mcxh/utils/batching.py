@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence
+
+
+class MicroBatcher:
+    """Dynamic micro-batching queue for model inference.
+
+    Items submitted from any thread are collected for up to
+    ``max_wait_ms`` after the first one arrives, or until ``max_batch_size``
+    items are pending, and then passed to ``batch_fn`` in a single call. Each
+    caller gets a future resolved with its own result.
+
+    Args:
+        batch_fn (Callable): Called with a list of items, must return a
+            sequence of results in the same order.
+        max_batch_size (int): Maximum number of items per call.
+            Defaults to 8.
+        max_wait_ms (float): How long to wait for more items once the first
+            one arrived, in milliseconds. Defaults to 5.
+        name (str): Name of the worker thread. Defaults to 'MicroBatcher'.
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0,
+                 name: str = 'MicroBatcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return the future of its result."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f'{self.name} is closed')
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Submit an item and wait for its result."""
+        return self.submit(item).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 \
+                    else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Finish the pending batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [(item, future) for item, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f'{self.name}: batch_fn returned {len(results)} '
+                        f'results for {len(batch)} items')
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self):
+        """Stop the worker after the pending items are processed."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._worker is not None:
+                self._queue.put(None)
+        if self._worker is not None and \
+                self._worker is not threading.current_thread():
+            self._worker.join()
@@ -0,0 +1,119 @@
+from typing import Optional
+
+import numpy as np
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    """Area of XYXY boxes with shape (N, 4)."""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * \
+        np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def nms(boxes: np.ndarray,
+        scores: np.ndarray,
+        iou_threshold: float = 0.45,
+        metric: str = 'iou',
+        groups: Optional[np.ndarray] = None,
+        partial: Optional[np.ndarray] = None) -> np.ndarray:
+    """Greedy non-maximum suppression in NumPy.
+
+    Each step compares the best remaining box with all the others at once.
+
+    Args:
+        boxes (np.ndarray): XYXY boxes with shape (N, 4).
+        scores (np.ndarray): Scores with shape (N, ).
+        iou_threshold (float): Boxes overlapping a kept box by more than
+            this are suppressed. Defaults to 0.45.
+        metric (str): ``'iou'`` for intersection over union, or ``'ios'``
+            for intersection over the smaller box, which also merges the
+            partial boxes of objects cut by a tile border. Defaults to 'iou'.
+        groups (np.ndarray, optional): Group of each box, e.g. the tile it
+            was detected on. With ``'ios'``, only pairs of boxes from
+            different groups are compared by intersection over the smaller
+            box, the others by IoU, so nested objects seen together are
+            kept. Defaults to None (every pair uses ``metric``).
+        partial (np.ndarray, optional): Whether each box may be cut, e.g.
+            touches an inner tile border. With ``groups``, ``'ios'`` then
+            only applies to pairs where one of the boxes is partial.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, by decreasing score.
+    """
+    if metric not in ('iou', 'ios'):
+        raise ValueError(f"metric must be 'iou' or 'ios', got {metric}")
+    boxes = np.asarray(boxes, dtype=np.float32)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if groups is not None:
+        groups = np.asarray(groups)
+    if partial is not None:
+        partial = np.asarray(partial, dtype=bool)
+
+    areas = box_area(boxes)
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        if metric == 'iou':
+            denom = areas[i] + areas[rest] - inter
+        else:
+            denom = np.minimum(areas[i], areas[rest])
+            if groups is not None:
+                merge = groups[rest] != groups[i]
+                if partial is not None:
+                    merge &= partial[rest] | partial[i]
+                union = areas[i] + areas[rest] - inter
+                denom = np.where(merge, denom, union)
+        overlap = inter / np.maximum(denom, 1e-9)
+        order = rest[overlap <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes: np.ndarray,
+                scores: np.ndarray,
+                classes: np.ndarray,
+                iou_threshold: float = 0.45,
+                metric: str = 'iou',
+                groups: Optional[np.ndarray] = None,
+                partial: Optional[np.ndarray] = None) -> np.ndarray:
+    """Class-aware NMS: boxes of different classes never suppress each other.
+
+    Boxes are shifted by a per-class offset larger than any coordinate, so a
+    single :func:`nms` pass handles every class; ``groups`` and
+    ``partial`` are passed on to it.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    offset = float(boxes.max()) + 1
+    shifted = boxes + (np.asarray(classes, dtype=np.float32) * offset)[:, None]
+    return nms(shifted, scores, iou_threshold, metric, groups, partial)
+
+
+def tile_starts(length: int, tile_size: int, overlap: float) -> np.ndarray:
+    """Start offsets of overlapping tiles covering ``length`` pixels."""
+    if length <= tile_size:
+        return np.zeros(1, dtype=np.int64)
+    step = max(1, int(tile_size * (1 - overlap)))
+    starts = np.arange(0, length - tile_size + 1, step)
+    if starts[-1] != length - tile_size:
+        starts = np.append(starts, length - tile_size)
+    return starts.astype(np.int64)
+
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: float) -> np.ndarray:
+    """XYXY windows of overlapping tiles covering an image, shape (T, 4)."""
+    ys = tile_starts(height, tile_size, overlap)
+    xs = tile_starts(width, tile_size, overlap)
+    x0, y0 = np.meshgrid(xs, ys)
+    x0, y0 = x0.reshape(-1), y0.reshape(-1)
+    x1 = np.minimum(x0 + tile_size, width)
+    y1 = np.minimum(y0 + tile_size, height)
+    return np.stack([x0, y0, x1, y1], axis=1)
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from .images_utils import content_digest
+
+
+def _tensor_nbytes(value) -> int:
+    if hasattr(value, 'element_size'):
+        return value.element_size() * value.numel()
+    return int(getattr(value, 'nbytes', 0))
+
+
+class EmbeddingCache:
+    """Two-tier cache of image embeddings keyed by image content.
+
+    The memory tier is an LRU bounded by the total size of the cached
+    features. With ``cache_dir`` set, every new embedding is also written
+    to ``<key>.npy`` (features) and ``<key>.json`` (sizes); a memory miss
+    then memory-maps the ``.npy`` file instead of running the encoder.
+
+    Args:
+        max_bytes (int): Size budget of the memory tier. 0 disables it.
+            Defaults to 1 GiB.
+        cache_dir (str, optional): Directory of the disk tier.
+            Defaults to None (memory only).
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30, cache_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image: np.ndarray, model_id: str, image_format: str = 'RGB') -> str:
+        """Key of an image for a given model, from a hash of its pixels."""
+        return content_digest(image, extra=f'{model_id}:{image_format}')
+
+    def _paths(self, key: str):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.npy', base + '.json'
+
+    def get(self, key: str, device=None) -> Optional[Dict[str, Any]]:
+        """Return ``{'features', 'original_size', 'input_size'}`` or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry)
+        entry = self._load(key, device)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return dict(entry)
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Cache an embedding, in memory and in ``cache_dir`` if set."""
+        entry = {
+            'features': entry['features'],
+            'original_size': tuple(entry['original_size']),
+            'input_size': tuple(entry['input_size']),
+        }
+        with self._lock:
+            self._remember(key, entry)
+        if self.cache_dir:
+            self._save(key, entry)
+
+    def _remember(self, key, entry):
+        nbytes = _tensor_nbytes(entry['features'])
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self._nbytes -= self._sizes.pop(key)
+        self._entries[key] = entry
+        self._sizes[key] = nbytes
+        self._nbytes += nbytes
+        self._trim()
+
+    def _trim(self):
+        while self._nbytes > self.max_bytes:
+            old, _ = self._entries.popitem(last=False)
+            self._nbytes -= self._sizes.pop(old)
+
+    def _load(self, key, device):
+        if not self.cache_dir:
+            return None
+        npy_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Tensors need the features in memory: read them once instead of
+            # mapping the file and copying the mapping
+            features = np.load(npy_path, mmap_mode=None if device is not None else 'r')
+        except (OSError, ValueError):
+            return None
+        if device is not None:
+            import torch
+            features = torch.from_numpy(features).to(device)
+        return {
+            'features': features,
+            'original_size': tuple(meta['original_size']),
+            'input_size': tuple(meta['input_size']),
+        }
+
+    def _save(self, key, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        npy_path, meta_path = self._paths(key)
+        features = entry['features']
+        if hasattr(features, 'detach'):
+            features = features.detach().cpu().numpy()
+        # The .json file is written last: it marks the entry as complete
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(npy_path + suffix, 'wb') as f:
+            np.save(f, np.asarray(features))
+        os.replace(npy_path + suffix, npy_path)
+        with open(meta_path + suffix, 'w') as f:
+            json.dump({'original_size': list(entry['original_size']),
+                       'input_size': list(entry['input_size'])}, f)
+        os.replace(meta_path + suffix, meta_path)
+
+    def clear(self, disk: bool = False):
+        """Drop the memory tier, and the disk tier too if ``disk``."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._nbytes = 0
+        if disk and self.cache_dir and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(('.npy', '.json')):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'nbytes': self._nbytes,
+                'max_bytes': self.max_bytes,
+                'cache_dir': self.cache_dir,
+            }
+
+
+_EMBEDDING_CACHE = EmbeddingCache()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache."""
+    return _EMBEDDING_CACHE
+
+
+def configure_embedding_cache(max_bytes: Optional[int] = None,
+                              cache_dir: Optional[str] = None) -> EmbeddingCache:
+    """Change the limits of the process-wide embedding cache.
+
+    Only the values passed are updated; pass ``cache_dir=''`` to turn the
+    disk tier off.
+    """
+    with _EMBEDDING_CACHE._lock:
+        if max_bytes is not None:
+            _EMBEDDING_CACHE.max_bytes = max_bytes
+            _EMBEDDING_CACHE._trim()
+        if cache_dir is not None:
+            _EMBEDDING_CACHE.cache_dir = cache_dir or None
+    return _EMBEDDING_CACHE
+
+
+def set_image_cached(predictor, image: np.ndarray, image_format: str = 'RGB',
+                     model_id: Optional[str] = None,
+                     cache: Optional[EmbeddingCache] = None,
+                     set_image: Optional[Callable] = None) -> bool:
+    """``predictor.set_image`` that reuses cached embeddings.
+
+    Works with the stateful ``segment_anything.SamPredictor``. ``set_image``
+    is the uncached method run on a miss, for subclasses overriding it;
+    defaults to ``predictor.set_image``.
+
+    Returns:
+        bool: Whether the embedding came from the cache.
+    """
+    cache = cache or _EMBEDDING_CACHE
+    model_id = model_id or sam_model_id(predictor.model)
+    key = cache.make_key(image, model_id, image_format)
+    entry = cache.get(key, device=predictor.device)
+    if entry is not None:
+        predictor.reset_image()
+        predictor.features = entry['features'].to(predictor.device)
+        predictor.original_size = entry['original_size']
+        predictor.input_size = entry['input_size']
+        predictor.is_image_set = True
+        return True
+    (set_image or predictor.set_image)(image, image_format)
+    cache.put(key, {'features': predictor.features,
+                    'original_size': predictor.original_size,
+                    'input_size': predictor.input_size})
+    return False
+
+
+def sam_model_id(model) -> str:
+    """Identity of SAM weights used in cache keys.
+
+    Models built by ``ag_mcxh.models.sam.build_sam`` carry their variant and
+    checkpoint; other models fall back to their architecture and a
+    fingerprint of their weights, stored on the model as ``model_id``.
+    """
+    model_id = getattr(model, 'model_id', None)
+    if model_id:
+        return model_id
+    encoder = model.image_encoder
+    model_id = (f'{type(model).__name__}:{len(encoder.blocks)}x{encoder.img_size}:'
+                f'{_weights_fingerprint(model)}')
+    try:
+        model.model_id = model_id
+    except AttributeError:
+        pass
+    return model_id
+
+
+def _weights_fingerprint(model, samples: int = 64) -> str:
+    """Hash of every parameter name and shape and of ``samples`` values
+    evenly spread over each parameter, to tell checkpoints apart without
+    reading all the weights."""
+    h = hashlib.blake2b(digest_size=8)
+    for name, param in model.state_dict().items():
+        values = param.detach().reshape(-1)
+        step = max(values.numel() // samples, 1)
+        h.update(f'{name}{tuple(param.shape)}'.encode())
+        h.update(values[::step][:samples].float().cpu().numpy().tobytes())
+    return h.hexdigest()
@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from ..types.io_types import array_key
+
+IMAGE_FORMATS = ('jpg', 'png', 'webp')
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(*arrays, extra: str = '', digest_size: int = 16) -> str:
+    """Hash the content of arrays (and an optional string) with blake2b.
+
+    Arrays handed out by an ``ImageIO`` are hashed by their content key
+    instead of their pixels.
+    """
+    h = hashlib.blake2b(digest_size=digest_size)
+    for array in arrays:
+        key = array_key(array) if isinstance(array, np.ndarray) else None
+        if key is None:
+            array = np.ascontiguousarray(array)
+        h.update(f'{array.dtype.str}{array.shape}'.encode())
+        if key is not None:
+            h.update(f'ImageIO:{key}'.encode())
+        elif array.size:
+            h.update(memoryview(array).cast('B'))
+    h.update(extra.encode())
+    return h.hexdigest()
+
+
+def encode_image(image: np.ndarray, fmt: str = 'jpg', quality: int = 95) -> bytes:
+    """Encode a BGR image.
+
+    Args:
+        image (np.ndarray): The image in HWC BGR uint8 format.
+        fmt (str): One of ``'jpg'``, ``'png'`` and ``'webp'``.
+        quality (int): JPEG/WebP quality in [0, 100]. For PNG it is mapped
+            to the compression level, higher quality compressing less.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    import cv2
+
+    fmt = fmt.lower().lstrip('.')
+    if fmt == 'jpeg':
+        fmt = 'jpg'
+    if fmt == 'jpg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif fmt == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    elif fmt == 'png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(round(9 - quality * 9 / 100))]
+    else:
+        raise ValueError(f'Unsupported image format {fmt}, '
+                         f'expected one of {IMAGE_FORMATS}')
+    ok, buffer = cv2.imencode(f'.{fmt}', image, params)
+    if not ok:
+        raise RuntimeError(f'Failed to encode image as {fmt}')
+    return buffer.tobytes()
+
+
+def draw_detections(image: np.ndarray, detections, thickness: int = 2) -> np.ndarray:
+    """Draw the boxes and labels of a ``DetectionResult`` on a copy of a BGR
+    image."""
+    import cv2
+
+    canvas = image.copy()
+    palette = np.random.default_rng(0).integers(0, 256, (256, 3)).tolist()
+    for (x1, y1, x2, y2), class_id, conf in zip(
+            detections.xyxy.astype(np.int64).tolist(),
+            detections.cls.tolist(), detections.conf.tolist()):
+        color = palette[class_id % 256]
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), color, thickness)
+        cv2.putText(canvas, f'{detections.class_name(class_id)} {conf:.2f}',
+                    (x1, max(y1 - 4, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    color, 1, cv2.LINE_AA)
+    return canvas
+
+
+def label_palette(num_labels: int, seed: int = 0) -> np.ndarray:
+    """Deterministic random colors for labels ``1..num_labels``.
+
+    Returns:
+        np.ndarray: A (num_labels + 1, 3) uint8 LUT whose row 0, the
+        background, is black.
+    """
+    palette = np.zeros((num_labels + 1, 3), dtype=np.uint8)
+    rng = np.random.default_rng(seed)
+    palette[1:] = (rng.random((num_labels, 3)) * 255).astype(np.uint8)
+    return palette
+
+
+def _mask_boxes(masks) -> np.ndarray:
+    if hasattr(masks, 'boxes'):
+        return masks.boxes()
+    boxes = np.zeros((len(masks), 4), dtype=np.float32)
+    for i, mask in enumerate(masks):
+        if hasattr(mask, 'bbox'):
+            x, y, w, h = mask.bbox
+            boxes[i] = (x, y, x + w, y + h)
+            continue
+        rows, cols = np.any(mask, axis=1), np.any(mask, axis=0)
+        if rows.any():
+            y0, y1 = np.argmax(rows), len(rows) - np.argmax(rows[::-1])
+            x0, x1 = np.argmax(cols), len(cols) - np.argmax(cols[::-1])
+            boxes[i] = (x0, y0, x1, y1)
+    return boxes
+
+
+def overlay_masks(image: np.ndarray,
+                  masks,
+                  colors: Optional[np.ndarray] = None,
+                  alpha: float = 0.3,
+                  boxes: Optional[np.ndarray] = None,
+                  seed: int = 0) -> np.ndarray:
+    """Alpha-blend colored masks on a copy of an image in one pass.
+
+    Each mask is only touched inside its bounding box, so the cost follows
+    the masked area rather than the number of masks times the image size.
+
+    Args:
+        image (np.ndarray): The HWC uint8 image.
+        masks: (N, H, W) binary masks, a ``LowResMasks`` of shape
+            (N, H, W) upscaled box by box, or a list of ``RLEMask``.
+        colors (np.ndarray, optional): (N, 3) colors in the image's channel
+            order. Defaults to None (``label_palette`` colors).
+        alpha (float): Opacity of the masks. Defaults to 0.3.
+        boxes (np.ndarray, optional): (N, 4) XYXY boxes containing each
+            mask. Defaults to None (computed from the masks).
+        seed (int): Palette seed when ``colors`` is None. Defaults to 0.
+
+    Returns:
+        np.ndarray: The blended uint8 image.
+    """
+    out = np.array(image, dtype=np.uint8, copy=True)
+    if len(masks) == 0:
+        return out
+    if hasattr(masks, 'detach'):
+        masks = masks.detach().cpu().numpy()
+    if colors is None:
+        colors = label_palette(len(masks), seed)[1:]
+    tints = np.asarray(colors, dtype=np.float32) * alpha
+    if boxes is None:
+        boxes = _mask_boxes(masks)
+    height, width = out.shape[:2]
+    boxes = np.round(np.asarray(boxes, dtype=np.float32)).astype(np.int64)
+    boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, width)
+    boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, height)
+
+    for i, (x0, y0, x1, y1) in enumerate(boxes.tolist()):
+        if x1 <= x0 or y1 <= y0:
+            continue
+        if hasattr(masks, 'upscale'):
+            mask = masks.upscale(i, crop=(x0, y0, x1, y1))
+        elif hasattr(masks[i], 'decode'):
+            mask = masks[i].decode()[y0:y1, x0:x1]
+        else:
+            mask = np.asarray(masks[i])[y0:y1, x0:x1] != 0
+        region = out[y0:y1, x0:x1]
+        region[mask] = region[mask] * (1 - alpha) + tints[i]
+    return out
+
+
+class AsyncImageWriter:
+    """Encode and write images on a background thread pool.
+
+    Files are content addressed: the caller passes a digest of whatever
+    determines the image, and the file is named ``<digest>.<fmt>`` in
+    ``output_dir``, so concurrent requests never overwrite each other and
+    identical renders are written only once. A failed write is logged,
+    leaves no file behind and raises from its future.
+
+    Args:
+        output_dir (str): The directory to write to.
+        fmt (str): The encoder format. Defaults to 'jpg'.
+        quality (int): The encoder quality. Defaults to 95.
+        max_workers (int): Number of writer threads. Defaults to 2.
+    """
+
+    def __init__(self,
+                 output_dir: str,
+                 fmt: str = 'jpg',
+                 quality: int = 95,
+                 max_workers: int = 2):
+        self.output_dir = output_dir
+        self.fmt = fmt.lower().lstrip('.')
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='AsyncImageWriter')
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.output_dir, f'{digest}.{self.fmt}')
+
+    def write(self, image: Union[np.ndarray, Callable[[], np.ndarray]],
+              digest: str) -> Tuple[str, Future]:
+        """Schedule an image to be rendered, encoded and written.
+
+        Args:
+            image (np.ndarray | Callable): A BGR image, or a callable
+                producing it, which then also runs in the background.
+            digest (str): The content digest naming the file.
+
+        Returns:
+            tuple[str, Future]: The output path and a future resolved with
+            it once the file is written.
+        """
+        path = self.path_for(digest)
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                if os.path.exists(path):
+                    future = Future()
+                    future.set_result(path)
+                    return path, future
+                future = self._executor.submit(self._write, image, path)
+                self._pending[path] = future
+                future.add_done_callback(lambda done: self._done(path, done))
+        return path, future
+
+    def _done(self, path: str, future: Future):
+        with self._lock:
+            self._pending.pop(path, None)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Failed to write image %s', path, exc_info=future.exception())
+
+    def _write(self, image, path: str) -> str:
+        if callable(image):
+            image = image()
+        data = encode_image(image, self.fmt, self.quality)
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # The file is only renamed to the returned path once complete
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def flush(self):
+        """Wait for every scheduled write to finish."""
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Finish pending writes and stop the writer threads."""
+        self._executor.shutdown(wait=True)
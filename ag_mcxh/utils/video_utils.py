@@ -0,0 +1,245 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+VideoSource = Union[str, int, Iterable[Any]]
+
+_END = object()
+
+
+class StageStats:
+    """Frame count and busy time of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+
+    def add(self, frames: int, seconds: float):
+        self.frames += frames
+        self.busy += seconds
+
+    @property
+    def fps(self) -> float:
+        """Frames per second of busy time, i.e. the stage's own capacity."""
+        return self.frames / self.busy if self.busy > 0 else 0.0
+
+
+def iter_video_frames(source: VideoSource,
+                      frame_skip: int = 0) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(frame index, BGR frame)`` from a video source.
+
+    Args:
+        source (str | int | Iterable): A video file, a stream URL (e.g.
+            ``rtsp://``), a camera index, or an iterable of frames.
+        frame_skip (int): Number of frames dropped after each yielded one.
+            Skipped video frames are only grabbed, not decoded.
+            Defaults to 0.
+    """
+    if isinstance(source, (str, int)):
+        import cv2
+
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError(f'Cannot open video source {source}')
+        try:
+            index = 0
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield index, frame
+                index += 1
+                for _ in range(frame_skip):
+                    if not capture.grab():
+                        return
+                    index += 1
+        finally:
+            capture.release()
+    else:
+        for index, frame in enumerate(source):
+            if index % (frame_skip + 1) == 0:
+                yield index, frame
+
+
+class VideoPipeline:
+    """Decode, inference and encoding stages running on separate threads.
+
+    The stages are connected with bounded queues, so a slow stage applies
+    back-pressure instead of buffering the whole video. Iterating the
+    pipeline yields ``(frame index, frame, output)`` in frame order.
+
+    Args:
+        source (str | int | Iterable): See :func:`iter_video_frames`.
+        infer_fn (Callable): Called with a list of frames, returns one raw
+            output per frame.
+        encode_fn (Callable, optional): Called with ``(frame, raw output)``,
+            returns the final output. Defaults to None (identity).
+        frame_skip (int): Frames dropped after each processed one.
+            Defaults to 0.
+        batch_size (int): Maximum number of frames already waiting that the
+            inference stage runs in one call. Defaults to 1.
+        queue_size (int): Capacity of each inter-stage queue. Defaults to 4.
+        realtime (bool): For live sources: drop the oldest waiting frame
+            instead of blocking the decoder when inference falls behind.
+            Defaults to False.
+    """
+
+    def __init__(self,
+                 source: VideoSource,
+                 infer_fn: Callable[[List[Any]], List[Any]],
+                 encode_fn: Optional[Callable[[Any, Any], Any]] = None,
+                 frame_skip: int = 0,
+                 batch_size: int = 1,
+                 queue_size: int = 4,
+                 realtime: bool = False):
+        self.source = source
+        self.infer_fn = infer_fn
+        self.encode_fn = encode_fn
+        self.frame_skip = frame_skip
+        self.batch_size = max(1, batch_size)
+        self.queue_size = queue_size
+        self.realtime = realtime
+        self.dropped = 0
+        self._stats = {name: StageStats(name) for name in ('decode', 'infer', 'encode')}
+        self._started = None
+        self._finished = None
+        self._delivered = 0
+
+    def _put(self, q: queue.Queue, item, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _decode(self, out_q, stop, errors):
+        stats = self._stats['decode']
+        try:
+            frames = iter_video_frames(self.source, self.frame_skip)
+            while not stop.is_set():
+                start = time.perf_counter()
+                item = next(frames, _END)
+                stats.add(0 if item is _END else 1, time.perf_counter() - start)
+                if item is _END:
+                    break
+                if self.realtime:
+                    while True:
+                        try:
+                            out_q.put_nowait(item)
+                            break
+                        except queue.Full:
+                            try:
+                                out_q.get_nowait()
+                                self.dropped += 1
+                            except queue.Empty:
+                                pass
+                elif not self._put(out_q, item, stop):
+                    break
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            self._put(out_q, _END, stop)
+
+    def _infer(self, in_q, out_q, stop, errors):
+        stats = self._stats['infer']
+        try:
+            done = False
+            while not done and not stop.is_set():
+                batch = [self._get(in_q, stop)]
+                while len(batch) < self.batch_size and batch[-1] is not _END:
+                    try:
+                        batch.append(in_q.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is _END:
+                    batch.pop()
+                    done = True
+                if batch:
+                    start = time.perf_counter()
+                    outputs = self.infer_fn([frame for _, frame in batch])
+                    stats.add(len(batch), time.perf_counter() - start)
+                    for (index, frame), output in zip(batch, outputs):
+                        if not self._put(out_q, (index, frame, output), stop):
+                            return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            self._put(out_q, _END, stop)
+
+    def _encode(self, in_q, out_q, stop, errors):
+        stats = self._stats['encode']
+        try:
+            while not stop.is_set():
+                item = self._get(in_q, stop)
+                if item is _END:
+                    break
+                index, frame, output = item
+                start = time.perf_counter()
+                if self.encode_fn is not None:
+                    output = self.encode_fn(frame, output)
+                stats.add(1, time.perf_counter() - start)
+                if not self._put(out_q, (index, frame, output), stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            self._put(out_q, _END, stop)
+
+    def __iter__(self) -> Iterator[Tuple[int, Any, Any]]:
+        decoded, inferred, encoded = (queue.Queue(self.queue_size) for _ in range(3))
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        threads = [
+            threading.Thread(target=self._decode, args=(decoded, stop, errors),
+                             name='VideoPipeline-decode', daemon=True),
+            threading.Thread(target=self._infer, args=(decoded, inferred, stop, errors),
+                             name='VideoPipeline-infer', daemon=True),
+            threading.Thread(target=self._encode, args=(inferred, encoded, stop, errors),
+                             name='VideoPipeline-encode', daemon=True),
+        ]
+        self._started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = encoded.get()
+                if item is _END:
+                    break
+                self._delivered += 1
+                yield item
+            if errors:
+                raise errors[0]
+        finally:
+            # Also reached when the consumer stops iterating early
+            stop.set()
+            for q in (decoded, inferred, encoded):
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+            for thread in threads:
+                thread.join(timeout=1.0)
+            self._finished = time.perf_counter()
+
+    def stats(self) -> Dict[str, float]:
+        """Per-stage FPS, end-to-end FPS and number of frames dropped."""
+        end = self._finished or time.perf_counter()
+        elapsed = end - self._started if self._started else 0.0
+        result = {f'{name}_fps': stage.fps for name, stage in self._stats.items()}
+        result['pipeline_fps'] = self._delivered / elapsed if elapsed > 0 else 0.0
+        result['frames'] = self._delivered
+        result['dropped'] = self.dropped
+        return result
@@ -0,0 +1,72 @@
+import sys
+import os
+import argparse
+import time
+
+# Add project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+
+def benchmark(name, fn, runs, warmup):
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {elapsed / runs * 1000:8.2f} ms/batch  {runs / elapsed:8.2f} batches/s")
+    return elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark YOLO eager PyTorch against onnxruntime on CPU')
+    parser.add_argument('--model_path', type=str, default='./yolo11n.pt', help='YOLO checkpoint')
+    parser.add_argument('--image', type=str, required=True, help='Path to image file')
+    parser.add_argument('--image_size', type=int, default=640)
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--intra_op_threads', type=int, default=0)
+    parser.add_argument('--inter_op_threads', type=int, default=0)
+    parser.add_argument('--conf_threshold', type=float, default=0.25)
+    args = parser.parse_args()
+
+    import cv2
+    from ultralytics import YOLO
+    from ag_mcxh.models import get_model_cls
+    from ag_mcxh.types import DetectionResult
+
+    image = cv2.imread(args.image)
+    if image is None:
+        print(f"Error: Cannot read image {args.image}")
+        return 1
+    batch = [image] * args.batch_size
+
+    eager = YOLO(args.model_path)
+    eager.to('cpu')
+    onnx = get_model_cls('YOLO-ONNX')(args.model_path,
+                                      image_size=args.image_size,
+                                      intra_op_threads=args.intra_op_threads,
+                                      inter_op_threads=args.inter_op_threads)
+    print(f"ONNX model: {onnx.onnx_path}")
+
+    eager_time = benchmark(
+        'eager', lambda: eager(batch, imgsz=args.image_size, conf=args.conf_threshold,
+                               device='cpu', verbose=False),
+        args.runs, args.warmup)
+    onnx_time = benchmark(
+        'onnxruntime', lambda: onnx(batch, conf=args.conf_threshold),
+        args.runs, args.warmup)
+    print(f"speedup      {eager_time / onnx_time:8.2f}x")
+
+    eager_boxes = len(DetectionResult.from_yolo(
+        eager(image, imgsz=args.image_size, conf=args.conf_threshold, verbose=False)[0]))
+    onnx_boxes = len(onnx(image, conf=args.conf_threshold)[0])
+    print(f"boxes        eager={eager_boxes} onnxruntime={onnx_boxes}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,8 +2,6 @@ from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 import sys
-import tempfile
-from werkzeug.utils import secure_filename
 
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -18,6 +16,7 @@ if project_root not in sys.path:
 # 导入VisionAgent
 try:
     from ag_mcxh import VisionAgent
+    from ag_mcxh.types import ImageIO
     print("成功导入VisionAgent")
 except ImportError as e:
     print(f"导入VisionAgent失败: {e}")
@@ -32,16 +31,11 @@ app = Flask(__name__, static_folder=static_folder)
 CORS(app)
 
 # 配置
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# 确保上传目录存在
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 # 全局变量存储VisionAgent实例
 agent = None
 
@@ -106,28 +100,21 @@ def process_image():
         return jsonify({'error': '提示不能为空'}), 400
     
     try:
-        # 保存文件到临时位置
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # 直接使用上传内容，不再写入磁盘再读回
+        image = ImageIO(file.read())
         
         # 处理图像
         if tool_name:
             # 直接调用指定工具
-            result = agent.direct_tool_call(tool_name, filepath, device="cpu")
+            result = agent.direct_tool_call(tool_name, image, device="cpu")
         else:
             # 使用vLLM自动选择工具
-            result = agent.process_with_vllm(prompt, filepath)
-        
-        # 清理上传的文件
-        os.remove(filepath)
+            result = agent.process_with_vllm(prompt, image)
         
-        return jsonify({'result': result})
+        # 工具结果的 JSON 文本只在此处生成一次
+        return jsonify({'result': str(result)})
     
     except Exception as e:
-        # 确保即使出错也清理文件
-        if 'filepath' in locals() and os.path.exists(filepath):
-            os.remove(filepath)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/tools', methods=['GET'])
@@ -179,6 +166,7 @@ def health_check():
     return jsonify({
         'status': 'ok',
         'vision_agent': agent is not None,
+        'tool_pool': agent.tool_pool_stats() if agent is not None else None,
         'message': 'Vision Agent WebUI Backend is running'
     })
 